@@ -0,0 +1,277 @@
+import argparse
+import itertools
+import json
+import logging
+import math
+import multiprocessing
+import os
+import traceback
+from pathlib import Path
+from time import perf_counter
+from typing import NamedTuple, Union
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from pygame.sprite import LayeredDirty
+
+import game
+from game_config import GameConfig
+from scenes.bots import BOT_LEVELS, bot_inputs
+from scenes.maps import Character, WindowsMap
+
+logger = logging.getLogger(__name__)
+
+# Balance values a sweep may change, mass is the body's
+STATS = ("full_hp", "rpm", "bullet_damage", "bullet_impulse", "mass")
+# Player names in --set, in the map's order
+PLAYERS = ("cpp", "python")
+
+# Columns every match writes, the swept values are added after them
+COLUMNS = {
+    "point": "i4",
+    "seed": "i8",
+    "winner": "i1",
+    "ticks": "i4",
+    "damage1": "f4",
+    "damage2": "f4",
+    "shots1": "i4",
+    "shots2": "i4",
+}
+
+# z of a two-sided 95% interval
+Z_95 = 1.959964
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Play bot matches across a grid of balance values and compare win rates")
+    parser.add_argument(
+        "--set", action="append", default=[], metavar="PLAYER.STAT=V1,V2,...", dest="sweeps",
+        help=f"values to sweep, PLAYER is one of {', '.join(PLAYERS)} and STAT one of {', '.join(STATS)}")
+    parser.add_argument(
+        "--matches", type=int, default=100,
+        help="matches for every point of the grid")
+    parser.add_argument(
+        "--bots", nargs=2, choices=BOT_LEVELS, default=("normal", "normal"), metavar="LEVEL",
+        help="levels of the two bots")
+    parser.add_argument(
+        "--max-ticks", type=int, default=60 * 60 * 5,
+        help="ticks a match may last before it counts as a draw")
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(),
+        help="processes playing matches")
+    parser.add_argument(
+        "--bullet-mode", choices=("pymunk", "numpy"), default="pymunk",
+        help="how the bullets are simulated")
+    parser.add_argument(
+        "--seed", type=int, default=0,
+        help="seed of the first match of every point, the others follow it")
+    parser.add_argument(
+        "--out", default="balance",
+        help="directory the columns are written to, one .npy file each")
+
+    args = parser.parse_args()
+    try:
+        args.grid = parse_grid(args.sweeps)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+# Every combination of the swept values, as a list of {"player.stat": value}
+def parse_grid(sweeps: list[str]) -> list[dict[str, float]]:
+    axes = {}
+    for sweep in sweeps:
+        name, _, values = sweep.partition("=")
+        player, _, stat = name.partition(".")
+        if player not in PLAYERS or stat not in STATS or not values:
+            raise ValueError(f"Invalid sweep {sweep!r}")
+        axes[name] = [float(value) for value in values.split(",")]
+
+    return [dict(zip(axes, values)) for values in itertools.product(*axes.values())]
+
+
+def apply_stat(character: Character, stat: str, value: float):
+    if stat == "full_hp":
+        character.full_hp = character.hp = value
+    elif stat == "rpm":
+        character.rpm = value
+        character.bullet_interval.ms = 1 / (value / 60) * 1000
+    elif stat == "mass":
+        character.body.mass = value
+    else:
+        setattr(character, stat, value)
+
+
+class MatchResult(NamedTuple):
+    point: int
+    seed: int
+    # 1 or 2, 0 for a draw
+    winner: int
+    ticks: int
+    damage1: float
+    damage2: float
+    shots1: int
+    shots2: int
+
+
+# A match that raised, the worker goes on with the next one
+class MatchFailure(NamedTuple):
+    point: int
+    seed: int
+    traceback: str
+
+
+def init_worker(bullet_mode: str):
+    # Ctrl+C and the pool's terminate() go to Python, SDL would swallow them and the pool would hang
+    os.environ["SDL_NO_SIGNAL_HANDLERS"] = "1"
+    GameConfig.instance(headless=True, bullet_mode=bullet_mode)
+    game.Game().instance().init_systems()
+
+
+def play(task: tuple[int, dict[str, float], int, tuple[str, str], int]) -> Union[MatchResult, MatchFailure]:
+    point, _, seed, _, _ = task
+    try:
+        return play_match(task)
+    except Exception:
+        return MatchFailure(point, seed, traceback.format_exc())
+
+
+def play_match(task: tuple[int, dict[str, float], int, tuple[str, str], int]) -> MatchResult:
+    point, values, seed, bots, max_ticks = task
+
+    game_map = WindowsMap(LayeredDirty(), seed, bot_inputs(bots, seed))
+    players = (game_map.player1, game_map.player2)
+    for name, value in values.items():
+        player, _, stat = name.partition(".")
+        apply_stat(players[PLAYERS.index(player)], stat, value)
+
+    player1, player2 = players
+    ticks = 0
+    while player1.hp > 0 and player2.hp > 0 and ticks < max_ticks:
+        game_map.fixed_update()
+        ticks += 1
+
+    winner = 0
+    if player2.hp <= 0 < player1.hp:
+        winner = 1
+    elif player1.hp <= 0 < player2.hp:
+        winner = 2
+
+    return MatchResult(
+        point, seed, winner, ticks,
+        min(player2.full_hp - player2.hp, player2.full_hp),
+        min(player1.full_hp - player1.hp, player1.full_hp),
+        player1.shots, player2.shots,
+    )
+
+
+class ColumnWriter:
+
+    # One preallocated .npy file per column, rows are written as they come in any order.
+    # Memory mapped, so whatever was written is there even if the run is stopped.
+    # Rows start out zeros, the done column tells the written ones from the rest
+    def __init__(self, directory: Path, columns: dict[str, str], rows: int):
+        directory.mkdir(parents=True, exist_ok=True)
+        self.columns = {
+            name: np.lib.format.open_memmap(directory / f"{name}.npy", mode="w+", dtype=dtype, shape=(rows,))
+            for name, dtype in {**columns, "done": "?"}.items()
+        }
+        self.rows = 0
+
+    def write(self, row: int, values: dict[str, float]):
+        for name, value in values.items():
+            self.columns[name][row] = value
+        # Last, so a row cut short by a stop isn't counted
+        self.columns["done"][row] = True
+        self.rows += 1
+
+    def flush(self):
+        for column in self.columns.values():
+            column.flush()
+
+
+# Wilson score interval of a proportion, good at small counts and rates near 0 or 1
+def wilson_interval(successes: int, trials: int, z: float = Z_95) -> tuple[float, float]:
+    if trials == 0:
+        return (0.0, 1.0)
+    p = successes / trials
+    denominator = 1 + z * z / trials
+    center = (p + z * z / (2 * trials)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / denominator
+    return (max(center - margin, 0.0), min(center + margin, 1.0))
+
+
+def report(grid: list[dict[str, float]], columns: dict[str, "np.ndarray"], tick_rate: int):
+    names = list(grid[0])
+    print(" ".join(f"{name:>20}" for name in names)
+          + f" {'matches':>7} {'cpp':>5} {'python':>6} {'draws':>5} {'cpp win rate (95%)':>22}"
+          f" {'sec':>6} {'damage':>13} {'shots':>11}")
+
+    for point, values in enumerate(grid):
+        mask = columns["done"] & (columns["point"] == point)
+        winners = columns["winner"][mask]
+        wins1 = int((winners == 1).sum())
+        wins2 = int((winners == 2).sum())
+        draws = int((winners == 0).sum())
+        # Draws say nothing about who is stronger, the rate is over decided matches
+        low, high = wilson_interval(wins1, wins1 + wins2)
+        rate = wins1 / (wins1 + wins2) if wins1 + wins2 else float("nan")
+        damage = f"{columns['damage1'][mask].mean():.0f}/{columns['damage2'][mask].mean():.0f}"
+        shots = f"{columns['shots1'][mask].mean():.0f}/{columns['shots2'][mask].mean():.0f}"
+
+        print(" ".join(f"{values[name]:>20g}" for name in names)
+              + f" {int(mask.sum()):>7} {wins1:>5} {wins2:>6} {draws:>5}"
+              f" {f'{rate:.2f} [{low:.2f}, {high:.2f}]':>22}"
+              f" {columns['ticks'][mask].mean() / tick_rate:>6.1f} {damage:>13} {shots:>11}")
+
+
+def main():
+    args = parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if np is None:
+        raise ImportError("The balance harness requires numpy")
+
+    grid = args.grid
+    tasks = [(point, values, args.seed + i, tuple(args.bots), args.max_ticks)
+             for point, values in enumerate(grid) for i in range(args.matches)]
+
+    out = Path(args.out)
+    columns = dict(COLUMNS)
+    columns.update((name, "f4") for name in grid[0])
+    writer = ColumnWriter(out, columns, len(tasks))
+    (out / "grid.json").write_text(json.dumps({"bots": args.bots, "bullet_mode": args.bullet_mode, "grid": grid}))
+
+    # Spawned the way Windows always does, so a worker starts without this process's singletons
+    context = multiprocessing.get_context("spawn")
+    start = perf_counter()
+    ticks = 0
+    played = 0
+    failures = 0
+    with context.Pool(args.workers, init_worker, (args.bullet_mode,)) as pool:
+        for result in pool.imap_unordered(play, tasks, chunksize=4):
+            played += 1
+            if isinstance(result, MatchFailure):
+                failures += 1
+                logger.error("Match of point %d with seed %d failed\n%s", result.point, result.seed, result.traceback)
+            else:
+                row = writer.rows
+                writer.write(row, {**result._asdict(), **grid[result.point]})
+                ticks += result.ticks
+
+            if played % 100 == 0 or played == len(tasks):
+                writer.flush()
+                elapsed = perf_counter() - start
+                logger.info("%d/%d matches, %d failed, %.0f ticks/s", played, len(tasks), failures, ticks / elapsed)
+
+    report(grid, writer.columns, GameConfig.instance().tick_rate)
+    print(f"results in {out}/, load a column with numpy.load({str(out / 'winner.npy')!r}),"
+          f" the rows of finished matches are where done.npy is true")
+
+
+if __name__ == "__main__":
+    main()
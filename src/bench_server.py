@@ -0,0 +1,144 @@
+import argparse
+import asyncio
+import logging
+import socket
+from random import Random
+from time import perf_counter
+
+import game
+from game_config import GameConfig
+from scenes.maps import Buttons
+from scenes.match_server import MatchWorker, input_packet
+
+logger = logging.getLogger(__name__)
+
+MATCH_COUNTS = (1, 5, 10, 20, 30, 40, 60, 80, 100, 120, 160, 200)
+# Seconds every count runs before it is measured, the matches start at once and catch up first
+WARM_UP_SEC = 2
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Find how many server matches one core keeps at the tick rate")
+    parser.add_argument(
+        "--bullet-mode", choices=("pymunk", "numpy"), default="pymunk",
+        help="how the bullets are simulated")
+    parser.add_argument(
+        "--seconds", type=float, default=5,
+        help="seconds every match count is measured for")
+    return parser.parse_args()
+
+
+class FakeClients:
+
+    # Both players of every match, sending what a client would with random held buttons
+    def __init__(self, worker: MatchWorker, address: tuple[str, int]):
+        self.worker = worker
+        self.address = address
+        self._random = Random(0)
+        # Match id to [seq, buttons, ticks left, jumps] of both players
+        self._players: dict[int, list[list[int]]] = {}
+
+    def send(self):
+        for match_id, match in self.worker.matches.items():
+            players = self._players.setdefault(match_id, [[0, 0, 0, 0], [0, 0, 0, 0]])
+            # The client got the state of the tick before, like over a quick connection
+            ack = max(match.map.space.time.ticks - 1, 0)
+            for player, state in enumerate(players):
+                state[0] += 1
+                if state[2] == 0:
+                    state[1] = self._random.getrandbits(4)
+                    state[2] = self._random.randrange(5, 40)
+                    if state[1] & Buttons.JUMP:
+                        state[3] = (state[3] + 1) % 256
+                state[2] -= 1
+                packet = input_packet(match_id, player, state[0], ack, int(state[1] & ~Buttons.JUMP), state[3])
+                self.worker.datagram_received(packet, self.address)
+
+
+async def measure(worker: MatchWorker, clients: FakeClients, count: int, seconds: float) -> dict:
+    dt = 1 / GameConfig.instance().tick_rate
+    tasks = [worker.start(match_id, match_id) for match_id in range(count)]
+    next_match = count
+
+    start = perf_counter()
+    measured = False
+    while perf_counter() - start < WARM_UP_SEC + seconds:
+        # Keep the count, a match that was won is replaced
+        for index, task in enumerate(tasks):
+            if task.done():
+                tasks[index] = worker.start(next_match, next_match)
+                next_match += 1
+
+        if not measured and perf_counter() - start >= WARM_UP_SEC:
+            measured = True
+            for match in worker.matches.values():
+                match.step_times.clear()
+                match.late_times.clear()
+            worker.busy = 0.0
+            worker.ticks = 0
+            busy_start = perf_counter()
+
+        clients.send()
+        await asyncio.sleep(dt)
+
+    elapsed = perf_counter() - busy_start
+    matches = list(worker.matches.values())
+    result = {
+        "matches": count,
+        "busy": worker.busy / elapsed,
+        "step_p50_ms": max(match.step_times.percentile(50) for match in matches) * 1000,
+        "step_p99_ms": max(match.step_times.percentile(99) for match in matches) * 1000,
+        "late_p99_ms": max(match.late_times.percentile(99) for match in matches) * 1000,
+        "ticks": worker.ticks,
+    }
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    worker.matches.clear()
+    return result
+
+
+async def run(args: argparse.Namespace):
+    loop = asyncio.get_running_loop()
+    worker = MatchWorker()
+    transport, _ = await loop.create_datagram_endpoint(lambda: worker, local_addr=("127.0.0.1", 0))
+
+    # Where the states go, never read so the kernel drops them once its buffer is full
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(("127.0.0.1", 0))
+    clients = FakeClients(worker, sink.getsockname())
+
+    tick_rate = GameConfig.instance().tick_rate
+    dt = 1 / tick_rate
+    print(f"{'matches':>7} {'busy %':>6} {'ticks/s':>8} {'step p50 ms':>11} {'step p99 ms':>11} {'late p99 ms':>11}")
+
+    sustained = 0
+    for count in MATCH_COUNTS:
+        result = await measure(worker, clients, count, args.seconds)
+        print(f"{result['matches']:>7} {result['busy'] * 100:>6.0f} {result['ticks'] / args.seconds:>8.0f}"
+              f" {result['step_p50_ms']:>11.3f} {result['step_p99_ms']:>11.3f} {result['late_p99_ms']:>11.3f}")
+
+        # Every match got nearly all its ticks, none of them more than a tick late
+        if result["ticks"] < count * tick_rate * args.seconds * 0.98 or result["late_p99_ms"] > dt * 1000:
+            break
+        sustained = count
+
+    transport.close()
+    sink.close()
+    print(f"one core sustains {sustained} matches at {tick_rate} Hz")
+
+
+def main():
+    args = parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    GameConfig.instance(headless=True, bullet_mode=args.bullet_mode)
+    game.Game().instance().init_systems()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
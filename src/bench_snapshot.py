@@ -0,0 +1,79 @@
+import argparse
+import logging
+from statistics import median
+from time import perf_counter
+
+import game
+from game_config import GameConfig
+from scenes.maps import Coord
+from system.scenes import Scenes
+
+logger = logging.getLogger(__name__)
+
+BULLET_COUNTS = (0, 10, 50, 100, 250, 500, 1000)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure BaseMap.snapshot, restore and a tick against live bullets")
+    parser.add_argument(
+        "--bullet-mode", choices=("pymunk", "numpy"), default="pymunk",
+        help="how the bullets are simulated")
+    parser.add_argument(
+        "--repeat", type=int, default=200,
+        help="measurements per bullet count, the median is reported")
+    return parser.parse_args()
+
+
+# before runs ahead of every measurement without being measured
+def measure_us(func, repeat: int, before=None) -> float:
+    times = []
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+    return median(times) * 1_000_000
+
+
+def main():
+    args = parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    GameConfig.instance(headless=True, bullet_mode=args.bullet_mode)
+
+    my_game = game.Game().instance()
+    my_game.init()
+
+    game_map = Scenes.instance().scene.map
+    player = game_map.player1
+
+    # Run the match for a moment, so the timers and contacts are in a usual state
+    for _ in range(120):
+        game_map.fixed_update()
+
+    print(f"{'bullets':>8} {'snapshot us':>12} {'restore us':>11} {'tick us':>8}")
+
+    live = 0
+    for count in BULLET_COUNTS:
+        # Spread over the empty middle of the map
+        while live < count:
+            pos = Coord(200 + live % 50 * 24, 400 + live // 50 % 16 * 24)
+            player.fire(pos)
+            live += 1
+
+        snapshot = game_map.snapshot()
+        snapshot_us = measure_us(game_map.snapshot, args.repeat)
+        # A tick runs ahead of every restore, as in a rollback, so there is a tick to undo
+        restore_us = measure_us(lambda: game_map.restore(snapshot), args.repeat, game_map.fixed_update)
+        # Always the tick right after the snapshot, with all of its bullets still in flight
+        tick_us = measure_us(game_map.fixed_update, args.repeat, lambda: game_map.restore(snapshot))
+
+        print(f"{count:>8} {snapshot_us:>12.1f} {restore_us:>11.1f} {tick_us:>8.1f}")
+
+    my_game.release()
+
+
+if __name__ == "__main__":
+    main()
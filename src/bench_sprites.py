@@ -0,0 +1,96 @@
+import argparse
+import logging
+import os
+from statistics import median
+from time import perf_counter
+
+from pymunk import Body
+
+import game
+from game_config import GameConfig
+from scenes.maps import Coord
+from system.scenes import Scenes
+
+logger = logging.getLogger(__name__)
+
+BULLET_COUNTS = (0, 10, 50, 100, 250, 500, 1000)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Measure placing the map's sprites every frame, with the entity store and entity by entity")
+    parser.add_argument(
+        "--repeat", type=int, default=200,
+        help="measurements per bullet count, the median is reported")
+    return parser.parse_args()
+
+
+# before runs ahead of every measurement without being measured
+def measure_us(func, repeat: int, before) -> float:
+    times = []
+    for _ in range(repeat):
+        before()
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+    return median(times) * 1_000_000
+
+
+def main():
+    args = parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    # A display is needed for the store, the dummy driver gives one without a window
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    GameConfig.instance()
+
+    my_game = game.Game().instance()
+    my_game.init_systems()
+
+    from scenes.play_scene import PlayScene
+    Scenes.instance().init(PlayScene())
+    scene = Scenes.instance().scene
+    game_map = scene.map
+    registry = game_map.space.registry
+    store = registry.store
+    if store is None:
+        raise ImportError("The entity store requires numpy")
+
+    player = game_map.player1
+
+    print(f"{'bullets':>8} {'store us':>9} {'per entity us':>14}")
+
+    live = 0
+    for count in BULLET_COUNTS:
+        while live < count:
+            pos = Coord(200 + live % 50 * 24, 400 + live // 50 % 16 * 24)
+            player.fire(pos)
+            live += 1
+
+        # Every bullet moves between two frames, as they do while flying
+        moving = [entity for entity in registry if entity.body.body_type != Body.STATIC]
+
+        def step():
+            for entity in moving:
+                x, y = entity.body.position
+                entity.body.position = (x + 1, y)
+
+        def with_store():
+            game_map.sync_sprites()
+            scene.sprites.update()
+
+        def per_entity():
+            registry.store = None
+            scene.sprites.update()
+            registry.store = store
+
+        store_us = measure_us(with_store, args.repeat, step)
+        per_entity_us = measure_us(per_entity, args.repeat, step)
+        print(f"{count:>8} {store_us:>9.1f} {per_entity_us:>14.1f}")
+
+    my_game.release()
+
+
+if __name__ == "__main__":
+    main()
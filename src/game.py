@@ -1,52 +1,138 @@
+import logging
+import os
+from time import perf_counter
+
 import pygame
 
 from common import SingletonInstane
 from game_config import GameConfig
 from scenes.loading_scene import LoadingScene
+from system.assets import Assets
 from system.clock import Clock
 from system.event_handler import EventHandler
+from system.profiler import Profiler
 from system.scenes import Scenes
 from system.screen import Screen
 
+logger = logging.getLogger(__name__)
+
 
 class Game(SingletonInstane):
     # return False if failed to init
     def init(self) -> bool:
 
+        self.init_systems()
+
+        # A replay or a network match goes straight to the match
+        config = GameConfig.instance()
+        scenes = Scenes.instance()
+        if config.headless or config.replay_path or config.net_role:
+            from scenes.play_scene import PlayScene
+            scenes.init(PlayScene())
+        else:
+            scenes.init(LoadingScene())
+
+        return True
+
+    # Everything but the scenes, enough to build and step maps
+    def init_systems(self):
+
+        config = GameConfig.instance()
+        if config.headless:
+            # No window, but surfaces can still be created and converted
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
+            os.environ["SDL_AUDIODRIVER"] = "dummy"
+
         pygame.init()
 
         # Get singleton classes
-        config = GameConfig.instance()
+        assets = Assets.instance()
         clock = Clock.instance()
         event_handler = EventHandler.instance()
-        scenes = Scenes.instance()
+        profiler = Profiler.instance()
         screen = Screen.instance()
 
         # Initialize system classes
         clock.init()
         event_handler.init()
+        profiler.init()
         screen.init()
-        scenes.init(LoadingScene())
-
-        return True
+        assets.init()
 
     # Main loop
     def loop(self):
 
+        if GameConfig.instance().headless:
+            self._loop_headless()
+            return
+
         # Get singleton classes
         clock = Clock.instance()
         event_handler = EventHandler.instance()
+        profiler = Profiler.instance()
         scenes = Scenes.instance()
 
         # Loop
         while not event_handler.is_quit:
             event_handler.update()
+            profiler.mark("event")
 
             scenes.update()
+            profiler.mark("update")
+            for _ in range(clock.fixed_steps()):
+                scenes.fixed_update()
+            profiler.mark("fixed")
             scenes.render()
+            profiler.mark("render")
 
             clock.tick()
+            profiler.mark("wait")
+            profiler.end_frame()
+
+    # Step the match as fast as possible, without drawing anything
+    def _loop_headless(self):
+
+        config = GameConfig.instance()
+        event_handler = EventHandler.instance()
+        profiler = Profiler.instance()
+        scenes = Scenes.instance()
+
+        scene = scenes.scene
+        ticks = 0
+        start = perf_counter()
+
+        while not event_handler.is_quit:
+            event_handler.update()
+            profiler.mark("event")
+
+            scenes.update()
+            profiler.mark("update")
+            # The match is over
+            if scenes.is_changed:
+                break
+
+            if 0 < config.headless_ticks <= ticks:
+                break
+
+            scenes.fixed_update()
+            ticks += 1
+            profiler.mark("fixed")
+            profiler.end_frame()
+
+        elapsed = perf_counter() - start
+        logger.info(
+            "Simulated %d ticks in %.3f s (%.0f ticks/s), winner: %s",
+            ticks, elapsed, ticks / max(elapsed, 1e-9), scene.winner or "none")
 
     def release(self):
 
+        Scenes.instance().release()
+
+        Profiler.instance().log_report()
+
+        # Compare cold and warm launches of the disk cache
+        assets = Assets.instance()
+        assets.log_stats()
+        assets.release()
+
         pygame.quit()
@@ -1,4 +1,5 @@
 import dataclasses
+from typing import Optional
 
 from common import SingletonInstane
 
@@ -8,5 +9,69 @@ class GameConfig(SingletonInstane):
     name: str = "War of Languages"
     fps: int = 60
 
+    # "native" draws at the monitor's resolution. "scaled" and "blit" draw at logical_size, so
+    # drawing and images cost the same on any monitor: "scaled" lets SDL scale the display,
+    # "blit" scales it with one blit a frame for drivers where SDL's scaling isn't available
+    render_mode: str = "native"
+    # Resolution drawn at by the scaled render modes, the map's coordinates are 1600 x 900
+    logical_size: tuple[int, int] = (1600, 900)
+    # Pixels that neither rect covers a merge of two dirty rects may redraw, 0 only merges
+    # rects the union adds nothing to
+    dirty_rect_waste: int = 2048
+    # Push the whole display instead of the dirty rects when it was measured to be cheaper
+    adaptive_full_update: bool = True
+
+    # Physics steps per second, independent of fps
+    tick_rate: int = 60
+    # Steps a slow frame may run to catch up before the game slows down
+    max_ticks_per_frame: int = 5
+    # "simulation" runs map timers on physics steps, "wall" on the real clock
+    timer_source: str = "simulation"
+
+    # "pymunk" simulates every bullet as a body, "numpy" uses the vectorized bullet field
+    bullet_mode: str = "pymunk"
+    # "projectile" fires bullets, "hitscan" resolves every shot with a segment query
+    weapon_mode: str = "projectile"
+
+    # Keep pre-scaled images in the user cache directory between launches
+    disk_cache: bool = True
+
+    # Run the match without a display and as fast as possible
+    headless: bool = False
+    # Screen size used without a display, the same as the map's coordinates
+    headless_size: tuple[int, int] = (1600, 900)
+    # Ticks a headless run may last, 0 runs until the match is over
+    headless_ticks: int = 0
+
+    # Seed of the map's random choices, None picks a new one every match
+    seed: Optional[int] = None
+    # Directory every match's inputs are recorded to, empty doesn't record
+    record_dir: str = ""
+    # Replay file played instead of the keyboard players, empty plays a normal match
+    replay_path: str = ""
+    # Step the replay starts from, earlier steps are re-simulated without drawing
+    replay_seek: int = 0
+
+    # Level of the bot playing each player, from scenes.bots.BOT_LEVELS, empty plays with the keyboard
+    bots: tuple[str, str] = ("", "")
+
+    # "host" or "client" plays against another computer, empty plays on one keyboard
+    net_role: str = ""
+    # Address the host listens on and the client joins, "host:port" or a port
+    net_address: str = ""
+    # Ticks the map may run ahead of the remote player's inputs before it waits for them
+    net_rollback_ticks: int = 12
+    # Latency, jitter and loss added to the packets this side sends, to try bad connections
+    net_latency_ms: int = 0
+    net_jitter_ms: int = 0
+    net_loss: float = 0.0
+
+    # Time the phases of every frame from the start, F3 toggles it and its overlay in a match
+    profile: bool = False
+    # Frames the profiler keeps the times and counts of
+    profile_frames: int = 240
+
     friends_file_path: str = "friends.csv"
     font: str = "arial"
+    # Number of rendered text surfaces kept by render_text
+    text_cache_size: int = 256
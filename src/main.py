@@ -1,7 +1,105 @@
+import argparse
+import logging
+
 import game
+from game_config import GameConfig
+from scenes.bots import BOT_LEVELS
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=GameConfig.name)
+    parser.add_argument(
+        "--headless", action="store_true",
+        help="simulate the match without a display, as fast as possible")
+    parser.add_argument(
+        "--render", choices=("native", "scaled", "blit"), default="native",
+        help="draw at the monitor's resolution, or at 1600x900 scaled up by SDL or by a blit")
+    parser.add_argument(
+        "--ticks", type=int, default=0,
+        help="stop a headless run after this many ticks (default: when the match is over)")
+    parser.add_argument(
+        "--seed", type=int, default=None,
+        help="seed of the map layout and timers (default: a new one every match)")
+    parser.add_argument(
+        "--record", metavar="DIR", default="",
+        help="record the inputs of every match to a new file in DIR")
+    parser.add_argument(
+        "--replay", metavar="FILE", default="",
+        help="play a recorded match, as fast as possible with --headless")
+    parser.add_argument(
+        "--seek", type=int, default=0,
+        help="start the replay from this tick")
+    parser.add_argument(
+        "--bot1", choices=BOT_LEVELS, default="",
+        help="let a bot of this level play the first player")
+    parser.add_argument(
+        "--bot2", choices=BOT_LEVELS, default="",
+        help="let a bot of this level play the second player")
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="time every frame from the start and show the profiler overlay, F3 toggles it")
+    parser.add_argument(
+        "--host", metavar="ADDR", default="",
+        help="host a match against another computer on [HOST:]PORT")
+    parser.add_argument(
+        "--connect", metavar="ADDR", default="",
+        help="join the match hosted on HOST:PORT")
+    parser.add_argument(
+        "--latency", type=int, default=0, metavar="MS",
+        help="delay the packets this side sends, to try a slow connection")
+    parser.add_argument(
+        "--jitter", type=int, default=0, metavar="MS",
+        help="vary the delay of every packet by up to this much")
+    parser.add_argument(
+        "--loss", type=float, default=0.0,
+        help="fraction of the packets this side sends that are dropped")
+
+    args = parser.parse_args()
+    if args.host and args.connect:
+        parser.error("--host and --connect can't be used together")
+    if (args.host or args.connect) and (args.headless or args.replay):
+        parser.error("a network match needs a display and live players")
+    if (args.bot1 or args.bot2) and (args.replay or args.host or args.connect):
+        parser.error("bots only play local matches")
+    return args
 
 
 def main():
+    args = parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    config = {
+        "headless": args.headless,
+        "render_mode": args.render,
+        "headless_ticks": args.ticks,
+        "seed": args.seed,
+        "record_dir": args.record,
+        "bots": (args.bot1, args.bot2),
+        "profile": args.profile,
+    }
+
+    if args.replay:
+        from scenes.replay import Replay
+        replay = Replay.load(args.replay)
+
+        # Play with the settings it was recorded with, and stop where the recording does
+        config.update(replay.config(), replay_path=args.replay, replay_seek=args.seek)
+        if not args.ticks:
+            config["headless_ticks"] = max(len(replay) - args.seek, 0)
+
+    if args.host or args.connect:
+        config.update(
+            net_role="host" if args.host else "client",
+            net_address=args.host or args.connect,
+            net_latency_ms=args.latency,
+            net_jitter_ms=args.jitter,
+            net_loss=args.loss,
+        )
+
+    # The config is a singleton, so it has to be created before anything reads it
+    GameConfig.instance(**config)
+
     my_game = game.Game().instance()
     my_game.init()
     my_game.loop()
@@ -0,0 +1,207 @@
+import argparse
+import json
+import logging
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from random import Random
+from time import perf_counter, sleep
+
+import game
+from game_config import GameConfig
+from scenes.maps import BaseInput, Buttons
+from scenes.netplay import checksum
+from scenes.replay import Replay
+from system.event_handler import EventHandler
+from system.scenes import Scenes
+
+logger = logging.getLogger(__name__)
+
+ROLES = ("host", "client")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Play a network match between two processes on this computer and check they agree")
+    parser.add_argument(
+        "--ticks", type=int, default=1200,
+        help="ticks to play, the match may end earlier")
+    parser.add_argument(
+        "--port", type=int, default=7777,
+        help="port the host listens on")
+    parser.add_argument(
+        "--latency", type=int, default=50, metavar="MS",
+        help="delay of the packets each side sends")
+    parser.add_argument(
+        "--jitter", type=int, default=20, metavar="MS",
+        help="variation of the delay")
+    parser.add_argument(
+        "--loss", type=float, default=0.05,
+        help="fraction of the packets each side sends that are dropped")
+    parser.add_argument(
+        "--bullet-mode", choices=("pymunk", "numpy"), default="pymunk",
+        help="how the bullets are simulated")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the match")
+    # Set on the two processes the check starts
+    parser.add_argument("--role", choices=ROLES, help=argparse.SUPPRESS)
+    parser.add_argument("--record", default="", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+class MashInput(BaseInput):
+
+    # Holds random buttons for a random while, so the other side mispredicts now and then.
+    # Like a key, a held jump only jumps once
+    def __init__(self, seed: int):
+        self._random = Random(seed)
+        self._held = 0
+        self._ticks = 0
+
+    def buttons(self) -> int:
+        if self._ticks == 0:
+            self._held = self._random.getrandbits(4)
+            self._ticks = self._random.randrange(5, 40)
+            self._ticks -= 1
+            return self._held
+
+        self._ticks -= 1
+        return int(self._held & ~Buttons.JUMP)
+
+    def jump(self) -> bool:
+        return bool(self.buttons() & Buttons.JUMP)
+
+    def left(self) -> bool:
+        return bool(self.buttons() & Buttons.LEFT)
+
+    def right(self) -> bool:
+        return bool(self.buttons() & Buttons.RIGHT)
+
+    def basic_attack(self) -> bool:
+        return bool(self.buttons() & Buttons.ATTACK)
+
+
+# One side of the match, in real time, prints what it ended with as a JSON line
+def run_peer(args: argparse.Namespace):
+    GameConfig.instance(
+        headless=True,
+        seed=args.seed,
+        bullet_mode=args.bullet_mode,
+        record_dir=args.record,
+        net_role=args.role,
+        net_address=f"127.0.0.1:{args.port}",
+        net_latency_ms=args.latency,
+        net_jitter_ms=args.jitter,
+        net_loss=args.loss,
+    )
+
+    my_game = game.Game().instance()
+    my_game.init()
+
+    event_handler = EventHandler.instance()
+    scenes = Scenes.instance()
+    session = scenes.scene.session
+    session.local_input = MashInput(ROLES.index(args.role))
+
+    dt = 1 / GameConfig.instance().tick_rate
+    next_tick = perf_counter()
+
+    finished = False
+    while True:
+        over = scenes.is_changed or session.ticks >= args.ticks
+        finished = over and session.is_confirmed
+        # Stay until the other side has every input, it may still need them to finish.
+        # Once it has, it may leave before this side hears so
+        if finished and (session.acked >= session.ticks or session.disconnected):
+            break
+        if session.disconnected:
+            break
+
+        if over:
+            session.poll()
+            session.send()
+        else:
+            event_handler.update()
+            scenes.update()
+            scenes.fixed_update()
+
+        next_tick += dt
+        sleep(max(next_tick - perf_counter(), 0))
+
+    result = {
+        "role": args.role,
+        "ticks": session.ticks,
+        "checksum": checksum(session.map.snapshot()),
+        "rollbacks": session.rollbacks,
+        "rollback_ticks": session.rollback_ticks,
+        "stalls": session.stalls,
+        "desyncs": session.desyncs,
+        "finished": finished,
+    }
+
+    my_game.release()
+    print(json.dumps(result), flush=True)
+
+
+# Play the recording of a side from the start, it has to end the same way the match did
+def replay_checksum(path: Path, ticks: int) -> int:
+    replay = Replay.load(str(path))
+    GameConfig.instance(headless=True, replay_path=str(path), **replay.config())
+
+    my_game = game.Game().instance()
+    my_game.init()
+
+    scene = Scenes.instance().scene
+    while scene.keyframes.ticks < ticks:
+        scene.fixed_update()
+    result = checksum(scene.map.snapshot())
+
+    my_game.release()
+    return result
+
+
+def main():
+    args = parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if args.role:
+        run_peer(args)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        processes = []
+        for role in ROLES:
+            command = [sys.executable, __file__, *sys.argv[1:], "--role", role, "--record", f"{directory}/{role}"]
+            processes.append(subprocess.Popen(command, stdout=subprocess.PIPE, text=True))
+
+        results = []
+        for process in processes:
+            output, _ = process.communicate()
+            if process.returncode != 0:
+                sys.exit(f"A side of the match failed with exit code {process.returncode}")
+            results.append(json.loads(output.splitlines()[-1]))
+
+        print(f"{'side':>6} {'ticks':>6} {'rollbacks':>9} {'re-simulated':>12} {'waited':>6} {'desyncs':>7} {'checksum':>10}")
+        for result in results:
+            print(f"{result['role']:>6} {result['ticks']:>6} {result['rollbacks']:>9} {result['rollback_ticks']:>12}"
+                  f" {result['stalls']:>6} {result['desyncs']:>7} {result['checksum']:>10}")
+
+        recordings = [next(Path(directory, role).glob("*.wolr")) for role in ROLES]
+        same_recordings = recordings[0].read_bytes() == recordings[1].read_bytes()
+        replayed = replay_checksum(recordings[0], results[0]["ticks"])
+
+    host, client = results
+    ok = (host["finished"] and client["finished"]
+          and host["ticks"] == client["ticks"]
+          and host["checksum"] == client["checksum"] == replayed
+          and host["desyncs"] == client["desyncs"] == 0
+          and same_recordings)
+
+    print(f"recordings equal: {same_recordings}, replay checksum: {replayed}")
+    print("ok" if ok else "the sides disagree")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
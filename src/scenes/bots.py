@@ -0,0 +1,211 @@
+from random import Random
+from typing import NamedTuple, Optional
+
+from pymunk import Vec2d
+
+from game_config import GameConfig
+from scenes.maps import (BULLET_SIZE, CALENDAR_HEIGHT, CALENDAR_PUSH_MS, CALENDAR_SPEED, CALENDAR_X, CALENDAR_Y,
+                         CHARACTER_SIZE, START_MENU_WIDTH, BaseInput, Bullet, Buttons, Calendar, Character,
+                         P1Input, P2Input, StartMenu)
+
+_JUMP = int(Buttons.JUMP)
+_LEFT = int(Buttons.LEFT)
+_RIGHT = int(Buttons.RIGHT)
+_ATTACK = int(Buttons.ATTACK)
+
+# Reach of the hazards a bot watches, in map coordinates
+START_MENU_RIGHT = START_MENU_WIDTH
+CALENDAR_LEFT = CALENDAR_X - CALENDAR_SPEED * CALENDAR_PUSH_MS / 1000
+CALENDAR_TOP = CALENDAR_Y + CALENDAR_HEIGHT
+# How far out of a hazard a bot stands, a push still reaches a bit beyond it
+HAZARD_MARGIN = 80
+# Height difference a jump is worth making for
+CLIMB_HEIGHT = 100
+# Seconds a jump takes to get out of the way of a bullet
+DODGE_SEC = 1 / 6
+# Ticks without a shot before a bot stops keeping its distance and goes looking for one
+PATIENCE_TICKS = 180
+
+
+class BotLevel(NamedTuple):
+    # Ticks between two looks at the map, the buttons are held in between
+    reaction_ticks: int
+    # Height difference to the opponent a shot is still taken at
+    aim_tolerance: float
+    # Chance a look ends with random buttons instead
+    blunder: float
+    # Jumps over bullets coming at it
+    dodges: bool
+    # Leaves the start menu and calendar before they move, not once they do
+    foresees_hazards: bool
+    # Horizontal distance kept from the opponent
+    distance: float
+
+
+BOT_LEVELS = {
+    "easy": BotLevel(reaction_ticks=20, aim_tolerance=15, blunder=0.3, dodges=False,
+                     foresees_hazards=False, distance=300),
+    "normal": BotLevel(reaction_ticks=10, aim_tolerance=30, blunder=0.1, dodges=True,
+                       foresees_hazards=False, distance=500),
+    "hard": BotLevel(reaction_ticks=4, aim_tolerance=40, blunder=0.0, dodges=True,
+                     foresees_hazards=True, distance=700),
+}
+
+
+class BotInput(BaseInput):
+
+    # Looks at the map every few ticks and holds what it decided until the next look.
+    # Like a key, a held jump only jumps once
+    def __init__(self, level: str, seed: int = 0):
+        self.level = BOT_LEVELS[level]
+        self._random = Random(seed)
+
+        self.character: Optional[Character] = None
+        # Found on the first look, the opponent is built after this bot is bound
+        self.opponent: Optional[Character] = None
+        self.start_menu: Optional[StartMenu] = None
+        self.calendar: Optional[Calendar] = None
+
+        self._held = 0
+        self._ticks = 0
+        # Ticks since the opponent was last at a height to shoot at
+        self._unaligned = 0
+
+    def bind(self, character: Character):
+        self.character = character
+
+    def _find(self):
+        for entity in self.character.space.registry:
+            if isinstance(entity, Character) and entity is not self.character:
+                self.opponent = entity
+            elif isinstance(entity, StartMenu):
+                self.start_menu = entity
+            elif isinstance(entity, Calendar):
+                self.calendar = entity
+
+    def buttons(self) -> int:
+        if self._ticks > 0:
+            self._ticks -= 1
+            return self._held & ~_JUMP
+
+        self._ticks = self.level.reaction_ticks - 1
+        self._held = self._decide()
+        return self._held
+
+    def jump(self) -> bool:
+        return bool(self._held & _JUMP)
+
+    def left(self) -> bool:
+        return bool(self._held & _LEFT)
+
+    def right(self) -> bool:
+        return bool(self._held & _RIGHT)
+
+    def basic_attack(self) -> bool:
+        return bool(self._held & _ATTACK)
+
+    def _decide(self) -> int:
+        if self.opponent is None:
+            self._find()
+            if self.opponent is None:
+                return 0
+
+        level = self.level
+        if level.blunder and self._random.random() < level.blunder:
+            return self._random.getrandbits(4)
+
+        me = self.character.body.position
+        other = self.opponent.body.position
+        dx = other.x - me.x
+        dy = other.y - me.y
+        toward = _RIGHT if dx > 0 else _LEFT
+        away = _LEFT if dx > 0 else _RIGHT
+
+        buttons = 0
+        if self._unaligned > PATIENCE_TICKS:
+            # Both may be stuck on ledges the other can't shoot at, so close in and hop around
+            buttons |= toward
+            if self._random.random() < 0.5:
+                buttons |= _JUMP
+        elif abs(dx) > level.distance + CHARACTER_SIZE:
+            buttons |= toward
+        elif abs(dx) < level.distance - CHARACTER_SIZE:
+            buttons |= away
+
+        if dy > CLIMB_HEIGHT:
+            buttons |= _JUMP
+
+        # Bullets fly straight, so a shot needs the same height and facing the opponent
+        if abs(dy) < level.aim_tolerance:
+            buttons = buttons & ~(_LEFT | _RIGHT) | toward | _ATTACK
+            self._unaligned = 0
+        else:
+            self._unaligned += level.reaction_ticks
+
+        if level.dodges and self._is_targeted(me):
+            buttons |= _JUMP
+
+        escape = self._hazard_escape(me)
+        if escape:
+            buttons = buttons & ~(_LEFT | _RIGHT) | escape
+
+        return buttons
+
+    # Whether a bullet of the opponent is at this height and coming close before the next look
+    def _is_targeted(self, me: Vec2d) -> bool:
+        # Until the next look, plus a jump's worth of time to get out of the way
+        reach_sec = self.level.reaction_ticks / GameConfig.instance().tick_rate + DODGE_SEC
+        bottom = me.y - BULLET_SIZE
+        top = me.y + CHARACTER_SIZE
+
+        field = self.character.bullet_field
+        if field is not None:
+            positions, velocities, owners, characters = field.live()
+            if not len(positions) or self.opponent not in characters:
+                return False
+
+            relative = positions[:, 0] - me.x
+            coming = ((owners == characters.index(self.opponent))
+                      & (relative * velocities[:, 0] < 0)
+                      & (abs(relative) < abs(velocities[:, 0]) * reach_sec + CHARACTER_SIZE)
+                      & (positions[:, 1] > bottom) & (positions[:, 1] < top))
+            return bool(coming.any())
+
+        for entity in self.character.space.registry:
+            if type(entity) is not Bullet or entity.owner is not self.opponent:
+                continue
+            position = entity.body.position
+            if not bottom < position.y < top:
+                continue
+            relative = position.x - me.x
+            speed = entity.body.velocity.x
+            if relative * speed < 0 and abs(relative) < abs(speed) * reach_sec + CHARACTER_SIZE:
+                return True
+        return False
+
+    # The way out of the start menu or the calendar when they are about to move, 0 when safe
+    def _hazard_escape(self, me: Vec2d) -> int:
+        # Ticks until the next look, in milliseconds
+        lookahead_ms = self.level.reaction_ticks * 1000 / GameConfig.instance().tick_rate
+
+        menu = self.start_menu
+        if menu is not None and me.x < START_MENU_RIGHT + HAZARD_MARGIN:
+            rising = menu.state != menu.states["stop"] or menu.stop_timer.is_activate
+            if rising or (self.level.foresees_hazards and menu.timer.remain() < lookahead_ms * 2):
+                return _RIGHT
+
+        calendar = self.calendar
+        if calendar is not None and me.x > CALENDAR_LEFT - HAZARD_MARGIN and me.y < CALENDAR_TOP:
+            pushing = calendar.state != calendar.states["stop"] or calendar.stop_timer.is_activate
+            if pushing or (self.level.foresees_hazards and calendar.timer.remain() < lookahead_ms * 2):
+                return _LEFT
+
+        return 0
+
+
+# A bot of the level for each player, or its keys for an empty level.
+# Seeded apart, so two bots of a level don't mirror each other
+def bot_inputs(levels: tuple[str, str], seed: int = 0) -> tuple[BaseInput, BaseInput]:
+    first = BotInput(levels[0], seed * 2) if levels[0] else P1Input()
+    second = BotInput(levels[1], seed * 2 + 1) if levels[1] else P2Input()
+    return first, second
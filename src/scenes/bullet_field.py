@@ -0,0 +1,196 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import pygame
+from pygame import Rect, Surface
+from pygame.sprite import DirtySprite, Group
+
+from scenes.maps import BULLET_SIZE, Character, CollisionTypes, Coord, MapSpace, Size
+from system.clock import Clock
+from system.screen import Screen
+
+WORLD_TYPES = (CollisionTypes.GROUND.value, CollisionTypes.WALL.value)
+
+
+class BulletField(DirtySprite):
+    """
+    Bullets stored as NumPy arrays instead of pymunk bodies.
+
+    Bullets fly in a straight line, so they are advanced in one vectorized step
+    and tested against the AABBs of the players and the world in batch.
+    The whole field is drawn as a single sprite over the bounds of its bullets.
+    """
+
+    def __init__(self, sprites: Group, space: MapSpace, capacity: int = 1024):
+        super().__init__()
+
+        if np is None:
+            raise ImportError("The numpy bullet mode requires numpy")
+
+        self.sprites = sprites
+        self.space = space
+
+        self.sprites.add(self)
+
+        # Struct of arrays, only the first self.count rows are alive
+        self.count = 0
+        self._pos = np.zeros((capacity, 2))
+        self._vel = np.zeros((capacity, 2))
+        self._damage = np.zeros(capacity)
+        self._owner = np.zeros(capacity, dtype=np.int16)
+
+        self._characters: list[Character] = []
+        self._character_ids: dict[Character, int] = {}
+
+        screen = Screen.instance()
+        self._bullet_px = Size(BULLET_SIZE, BULLET_SIZE).height.to_px()
+
+        # Bullets are drawn where they are on the screen, and only the part they are in is shown
+        self.image = Surface(screen.size, pygame.SRCALPHA)
+        self.source_rect = Rect(0, 0, 0, 0)
+        self.rect = self.source_rect.copy()
+        self._drawn = False
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _character_id(self, character: Character) -> int:
+        idx = self._character_ids.get(character)
+        if idx is None:
+            idx = len(self._characters)
+            self._characters.append(character)
+            self._character_ids[character] = idx
+        return idx
+
+    def _grow(self):
+        capacity = len(self._damage) * 2
+        self._pos = np.resize(self._pos, (capacity, 2))
+        self._vel = np.resize(self._vel, (capacity, 2))
+        self._damage = np.resize(self._damage, capacity)
+        self._owner = np.resize(self._owner, capacity)
+
+    def fire(self, owner: Character, pos: Coord, velocity: tuple[float, float]):
+        if self.count == len(self._damage):
+            self._grow()
+
+        i = self.count
+        self._pos[i] = pos.to_tuple()
+        self._vel[i] = velocity
+        self._damage[i] = owner.bullet_damage
+        self._owner[i] = self._character_id(owner)
+        self.count += 1
+
+    # Positions, velocities and owner indices of the live bullets as views, and the characters the indices refer to
+    def live(self) -> tuple["np.ndarray", "np.ndarray", "np.ndarray", list[Character]]:
+        n = self.count
+        return self._pos[:n], self._vel[:n], self._owner[:n], self._characters
+
+    def snapshot(self) -> tuple:
+        n = self.count
+        return (self._pos[:n].copy(), self._vel[:n].copy(), self._damage[:n].copy(), self._owner[:n].copy())
+
+    def restore(self, state: tuple):
+        pos, vel, damage, owner = state
+        n = len(damage)
+        while len(self._damage) < n:
+            self._grow()
+
+        self._pos[:n] = pos
+        self._vel[:n] = vel
+        self._damage[:n] = damage
+        self._owner[:n] = owner
+        self.count = n
+
+    def step(self, dt: float):
+        n = self.count
+        if n == 0:
+            return
+
+        pos = self._pos[:n]
+        vel = self._vel[:n]
+        pos += vel * dt
+
+        left = pos[:, 0, None]
+        bottom = pos[:, 1, None]
+        right = left + BULLET_SIZE
+        top = bottom + BULLET_SIZE
+
+        players = []
+        world = []
+        for entity in self.space.registry:
+            collision_type = entity.shape.collision_type
+            if collision_type == CollisionTypes.PLAYER.value:
+                players.append(entity)
+            elif collision_type in WORLD_TYPES:
+                world.append(entity.shape.bb)
+
+        # (bullets, boxes) overlap matrix against every world box
+        dead = np.zeros(n, dtype=bool)
+        if world:
+            boxes = np.array(world).T
+            dead = ((left < boxes[2]) & (right > boxes[0])
+                    & (bottom < boxes[3]) & (top > boxes[1])).any(axis=1)
+
+        for player in players:
+            # A bullet never hits the character that fired it
+            bb = player.shape.bb
+            hits = ((left[:, 0] < bb.right) & (right[:, 0] > bb.left)
+                    & (bottom[:, 0] < bb.top) & (top[:, 0] > bb.bottom)
+                    & (self._owner[:n] != self._character_id(player)))
+
+            if not hits.any():
+                continue
+
+            for damage in self._damage[:n][hits]:
+                player.hit(float(damage))
+
+            # Bullets have a mass of 1, so the knockback is their summed velocity
+            impulse = vel[hits].sum(axis=0)
+            player.apply_impulse((float(impulse[0]), float(impulse[1])))
+
+            dead |= hits
+
+        if dead.any():
+            alive = ~dead
+            k = int(alive.sum())
+            self._pos[:k] = pos[alive]
+            self._vel[:k] = vel[alive]
+            self._damage[:k] = self._damage[:n][alive]
+            self._owner[:k] = self._owner[:n][alive]
+            self.count = k
+
+    def update(self):
+        if self.count == 0 and not self._drawn:
+            return
+
+        # The group clears where the field was last drawn, so only those bounds are cleared here
+        self.dirty = 1
+        self.image.fill((0, 0, 0, 0), self.source_rect)
+
+        n = self.count
+        self._drawn = n > 0
+        if n == 0:
+            self.source_rect = Rect(self.source_rect.topleft, (0, 0))
+            self.rect = self.source_rect.copy()
+            return
+
+        # Bullets move in a straight line, so interpolating is stepping back along the velocity
+        clock = Clock.instance()
+        pos = self._pos[:n] + self._vel[:n] * (clock.delta_sec() * (clock.alpha() - 1))
+
+        px = Screen.instance().viewport.coords_to_px(pos)
+        xs = px[:, 0]
+        ys = px[:, 1] - self._bullet_px
+
+        images = [character.bullet_img for character in self._characters]
+        self.image.blits(
+            [(images[owner], (x, y)) for owner, x, y in zip(self._owner[:n].tolist(), xs.tolist(), ys.tolist())],
+            doreturn=False)
+
+        left = int(xs.min())
+        top = int(ys.min())
+        bounds = Rect(left, top, int(xs.max()) - left + self._bullet_px, int(ys.max()) - top + self._bullet_px)
+        self.source_rect = bounds.clip(self.image.get_rect())
+        self.rect = self.source_rect.copy()
@@ -0,0 +1,126 @@
+from pymunk import Body, Circle, Space
+# Chipmunk calls pymunk doesn't wrap, or wraps too slowly to make for every entity every tick,
+# and the solver state a snapshot needs that pymunk keeps to its own copy and pickle support.
+# They depend on the layout of pymunk's chipmunk, which is why pymunk is pinned exactly in
+# requirements.txt. Nothing else reaches into its internals
+from pymunk._chipmunk import ffi, lib as cp
+
+# Collision type no shape has, its wildcard handler is the one that does nothing
+_NO_COLLISION_TYPE = 0xFFFF
+
+# Chipmunk's arbiter states
+_ARBITER_STATE_NORMAL = 1
+_ARBITER_STATE_CACHED = 3
+
+
+def body_position(body: Body) -> tuple[float, float]:
+    position = cp.cpBodyGetPosition(body._body)
+    return (position.x, position.y)
+
+
+# Position and velocity as x, y, vx, vy
+def body_state(body: Body) -> tuple[float, float, float, float]:
+    handle = body._body
+    position = cp.cpBodyGetPosition(handle)
+    velocity = cp.cpBodyGetVelocity(handle)
+    return (position.x, position.y, velocity.x, velocity.y)
+
+
+def set_body_state(body: Body, state: tuple[float, float, float, float]):
+    handle = body._body
+    cp.cpBodySetPosition(handle, state[:2])
+    cp.cpBodySetVelocity(handle, state[2:])
+
+
+# The solver pushes bodies out of each other with a velocity it keeps for the start of the next
+# step, which nothing can read back. Moving the body by it right after the step leaves nothing
+# of a step behind outside the position and velocity
+def apply_position_bias(body: Body, dt: float):
+    handle = body._body
+    velocity = cp.cpBodyGetVelocity(handle)
+    cp.cpBodySetVelocity(handle, (0, 0))
+    cp.cpBodyUpdatePosition(handle, dt)
+    cp.cpBodySetVelocity(handle, velocity)
+
+
+def shape_id_counter(space: Space) -> int:
+    return cp.cpSpaceGetShapeIDCounter(space._space)
+
+
+# Ids of the shapes added next start from it
+def set_shape_id_counter(space: Space, counter: int):
+    cp.cpSpaceSetShapeIDCounter(space._space, counter)
+
+
+# The table of a spatial hash's shapes grows as shapes are added and never shrinks, and growing
+# reorders it. Growing it at once to fit the count makes the order only depend on the shapes
+# added since, so shapes that leave and join again are found in the same order
+def reserve_shapes(space: Space, count: int):
+    body = Body(body_type=Body.KINEMATIC)
+    shapes = [Circle(body, 1) for _ in range(count)]
+    space.add(body, *shapes)
+    space.remove(*shapes, body)
+
+
+class ContactCache:
+
+    # The solver's contacts of the space. Every pair touching after a step is cached with the
+    # impulses it took, which the next step starts from and which decide whether its begin
+    # callback runs, so a snapshot has to carry them. A space with a collision persistence of 1
+    # only keeps the pairs the last step touched, which puts every one of them in the same state
+    def __init__(self, space: Space):
+        assert space.collision_persistence == 1, "Only pairs of the last step can be restored"
+
+        self.space = space
+        self._dropped = space.add_wildcard_collision_handler(_NO_COLLISION_TYPE)._handler
+
+    def _arbiters(self) -> list:
+        arbiters = []
+        cp.cpSpaceEachCachedArbiter(self.space._space, cp.ext_cpArbiterIteratorFunc, ffi.new_handle(arbiters))
+        return arbiters
+
+    # The touching pairs as (shape a, shape b, contacts), a contact as its id and impulses.
+    # The next step works out the rest of a pair again before it reads it. Pairs a restore
+    # dropped are still cached until the next step, without their shapes
+    def snapshot(self) -> tuple:
+        space = self.space
+        return tuple(
+            (space._get_shape(arbiter.a), space._get_shape(arbiter.b),
+             tuple((contact.hash, contact.jnAcc, contact.jtAcc)
+                   for contact in arbiter.contacts[0:arbiter.count]))
+            for arbiter in self._arbiters() if arbiter.a != ffi.NULL)
+
+    # Pairs cached now are reused when the snapshot has them, the others are dropped: they no
+    # longer match their shapes and the next step removes them without a separate callback
+    def restore(self, state: tuple):
+        handle = self.space._space
+        stamp = cp.cpSpaceGetTimestamp(handle)
+
+        cached = {(arbiter.a, arbiter.b): arbiter for arbiter in self._arbiters()}
+        restored = []
+        for a, b, contacts in state:
+            arbiter = cached.pop((a._shape, b._shape), None)
+            if arbiter is None:
+                arbiter = cp.cpArbiterNew(a._shape, b._shape)
+            restored.append((arbiter, contacts))
+
+        for arbiter in cached.values():
+            arbiter.a = arbiter.b = ffi.NULL
+            arbiter.count = 0
+            arbiter.contacts = ffi.NULL
+            arbiter.handler = self._dropped
+            arbiter.state = _ARBITER_STATE_CACHED
+
+        for arbiter, contacts in restored:
+            array = cp.cpContactArrAlloc(len(contacts))
+            for i, (contact_hash, jn, jt) in enumerate(contacts):
+                array[i].hash = contact_hash
+                array[i].jnAcc = jn
+                array[i].jtAcc = jt
+
+            arbiter.count = len(contacts)
+            arbiter.contacts = array
+            arbiter.stamp = stamp
+            arbiter.state = _ARBITER_STATE_NORMAL
+            # Copies the contacts into the space and frees the array
+            cp.cpSpaceAddCachedArbiter(handle, arbiter)
@@ -1,14 +1,24 @@
 import platform
+from collections import OrderedDict
 
 import pygame
-from pygame import Rect, Surface
+from pygame import Rect, Surface, draw
 from pygame.sprite import DirtySprite, Group
 
+from common import SingletonInstane
 from game_config import GameConfig
 from system.clock import Clock
 from system.event_handler import EventHandler
+from system.profiler import Profiler, percentiles_ms, phase_label
 from system.screen import Screen
 
+# Fonts the profiler overlay tries in order, its columns only line up in a monospaced one
+MONOSPACE_FONT = "consolas,menlo,dejavusansmono,monospace"
+# Frames between redraws of the profiler overlay, faster would be too fast to read
+OVERLAY_REFRESH_FRAMES = 6
+# Above the map and the HUD
+OVERLAY_LAYER = 10
+
 
 def px_to_pt(px: int) -> int:
     pt = 0
@@ -20,11 +30,49 @@ def px_to_pt(px: int) -> int:
     return pt
 
 
-def render_text(text: str, px: int) -> Surface:
-    pt = px_to_pt(px)
-    font_name = GameConfig.instance().font
-    font = pygame.font.SysFont(font_name, pt)
-    return font.render(text, True, "white")
+class TextCache(SingletonInstane):
+
+    def __init__(self):
+        self.capacity: int = GameConfig.instance().text_cache_size
+
+        self.hits = 0
+        self.misses = 0
+
+        self._fonts: dict[tuple[str, int], pygame.font.Font] = {}
+        self._surfaces: OrderedDict[tuple[str, int, str], Surface] = OrderedDict()
+
+    def font(self, name: str, pt: int) -> pygame.font.Font:
+        key = (name, pt)
+        font = self._fonts.get(key)
+        if font is None:
+            font = pygame.font.SysFont(name, pt)
+            self._fonts[key] = font
+        return font
+
+    # The returned surface is shared, blit it but never draw on it
+    def render(self, text: str, px: int, color: str) -> Surface:
+        key = (text, px, color)
+
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self._surfaces.move_to_end(key)
+            return surface
+
+        self.misses += 1
+
+        font = self.font(GameConfig.instance().font, px_to_pt(px))
+        surface = font.render(text, True, color)
+
+        self._surfaces[key] = surface
+        if len(self._surfaces) > self.capacity:
+            self._surfaces.popitem(last=False)
+
+        return surface
+
+
+def render_text(text: str, px: int, color: str = "white") -> Surface:
+    return TextCache.instance().render(text, px, color)
 
 
 class RatioCoord:
@@ -52,12 +100,7 @@ class RatioRect:
         self.h: float = h
 
     def to_pyrect(self) -> Rect:
-        screen = Screen.instance()
-        x = screen.width * self.x
-        y = screen.height * self.y
-        w = screen.width  * self.w
-        h = screen.height * self.h
-        return Rect(x, y, w, h)
+        return Screen.instance().viewport.ratio_to_px(self.x, self.y, self.w, self.h)
 
     @property
     def left(self) -> float:
@@ -185,6 +228,76 @@ class FPS(Text):
         self.set_text(text)
 
 
+class ProfilerOverlay(DirtySprite):
+
+    # Phase percentiles, counters and a graph of the last frames, shown while the profiler is enabled
+    def __init__(self, rect: RatioRect):
+        super().__init__()
+        self.layer = OVERLAY_LAYER
+
+        self.rect = rect.to_pyrect()
+        self.image = Surface(self.rect.size, pygame.SRCALPHA)
+        self.visible = 0
+
+        self._frames = 0
+
+    def _create_surface(self, profiler: Profiler) -> Surface:
+        surface = Surface(self.rect.size, pygame.SRCALPHA)
+        surface.fill((0, 0, 0, 176))
+
+        lines = [f"{'ms':<15} {'p50':>6} {'p95':>6} {'p99':>6}"]
+        for phase, samples in (("frame", profiler.frames), *profiler.phases.items()):
+            p50, p95, p99 = percentiles_ms(samples)
+            lines.append(f"{phase_label(phase):<15} {p50:6.2f} {p95:6.2f} {p99:6.2f}")
+
+        # Counts of the last frame
+        counts = {counter: samples.values()[-1] if len(samples) else 0
+                  for counter, samples in profiler.counters.items()}
+        lines.append(f"bullets {counts['bullets']:.0f}, callbacks {counts['callbacks']:.0f}"
+                     f" ({profiler.counters['callbacks'].max():.0f} max)")
+        lines.append(f"rects {counts['drawn_rects']:.0f} drawn, {counts['pushed_rects']:.0f} pushed")
+        lines.append(f"pixels {counts['pushed_pixels']:.0f} pushed")
+
+        line_height = self.rect.height // 24
+        font = TextCache.instance().font(MONOSPACE_FONT, px_to_pt(line_height))
+        # The numbers change at every redraw, so they aren't kept in the text cache
+        for i, line in enumerate(lines):
+            surface.blit(font.render(line, True, "white"), (line_height // 2, line_height * (i + 0.5)))
+
+        # Time every frame spent before waiting for the next, against the frame budget in the middle
+        graph = Rect(0, line_height * (len(lines) + 1), self.rect.width, 0)
+        graph.height = self.rect.height - graph.top
+        budget = 1 / GameConfig.instance().fps
+        frames = profiler.frames.values()
+        waits = profiler.phases["wait"].values()
+
+        width = graph.width / max(len(frames), 1)
+        for i, (frame, wait) in enumerate(zip(frames, waits)):
+            busy = frame - wait
+            height = min(round(busy / (budget * 2) * graph.height), graph.height)
+            color = "#009830" if busy <= budget else "#d03030"
+            draw.rect(surface, color, (round(i * width), graph.bottom - height, max(round(width), 1), height))
+        draw.line(surface, "white", (0, graph.centery), (graph.right, graph.centery))
+
+        return surface
+
+    def update(self):
+        profiler = Profiler.instance()
+        if not profiler.is_enabled:
+            if self.visible:
+                self.visible = 0
+                self.dirty = 1
+            return
+
+        self._frames += 1
+        if self.visible and self._frames % OVERLAY_REFRESH_FRAMES:
+            return
+
+        self.image = self._create_surface(profiler)
+        self.visible = 1
+        self.dirty = 1
+
+
 class Button(DirtySprite):
 
     def __init__(self, rect: RatioRect):
@@ -0,0 +1,150 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from typing import TYPE_CHECKING
+
+from pymunk import Body
+
+from system.screen import Viewport
+from scenes.chipmunk import body_position
+
+if TYPE_CHECKING:
+    from scenes.maps import Entity
+
+HAS_NUMPY = np is not None
+
+# Pixel position of a row that was never synced, so its first sync always marks it dirty
+UNSYNCED = -(2 ** 31)
+
+
+class EntityStore:
+    # The entities of a map as rows of NumPy arrays, for drawing them. Positions, pixel rects,
+    # dirty flags and collision types are kept as a struct of arrays, so sync() places every
+    # moving sprite in one vectorized pass and only marks the ones whose pixels changed.
+    # Rows follow the registry, a removed row is filled with the last one
+    def __init__(self, capacity: int = 256):
+        self.count = 0
+        self._entities: list["Entity"] = []
+        self._rows: dict["Entity", int] = {}
+
+        # Coordinates drawn by the last sync, and the pixel rect they gave as x, y, w, h
+        self._pos = np.zeros((capacity, 2))
+        self._rect = np.zeros((capacity, 4), dtype=np.int32)
+        self._dirty = np.zeros(capacity, dtype=bool)
+        self._collision_type = np.zeros(capacity, dtype=np.int8)
+        # Entities are registered before they have a rect or their body type, so both are read on their first sync
+        self._moving = np.zeros(capacity, dtype=bool)
+        self._is_known = np.zeros(capacity, dtype=bool)
+
+        # Rows and entities of the moving rows, rebuilt when rows change
+        self._moving_rows = np.zeros(0, dtype=np.intp)
+        self._moving_entities: list["Entity"] = []
+        self._is_changed = False
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, entity: "Entity") -> bool:
+        return entity in self._rows
+
+    def _grow(self):
+        capacity = len(self._dirty) * 2
+        self._pos = np.resize(self._pos, (capacity, 2))
+        self._rect = np.resize(self._rect, (capacity, 4))
+        self._dirty = np.resize(self._dirty, capacity)
+        self._collision_type = np.resize(self._collision_type, capacity)
+        self._moving = np.resize(self._moving, capacity)
+        self._is_known = np.resize(self._is_known, capacity)
+
+    def add(self, entity: "Entity"):
+        if entity in self._rows:
+            return
+        if self.count == len(self._dirty):
+            self._grow()
+
+        row = self.count
+        self._entities.append(entity)
+        self._rows[entity] = row
+        self._rect[row, :2] = UNSYNCED
+        self._dirty[row] = True
+        self._is_known[row] = False
+        self.count += 1
+        self._is_changed = True
+
+    def remove(self, entity: "Entity"):
+        row = self._rows.pop(entity, None)
+        if row is None:
+            return
+
+        last = self.count - 1
+        moved = self._entities.pop()
+        if row != last:
+            self._entities[row] = moved
+            self._rows[moved] = row
+            for column in (self._pos, self._rect, self._dirty, self._collision_type, self._moving, self._is_known):
+                column[row] = column[last]
+        self.count = last
+        self._is_changed = True
+
+    def _refresh(self):
+        n = self.count
+        for row in range(n):
+            if self._is_known[row]:
+                continue
+            entity = self._entities[row]
+            self._rect[row, 2:] = entity.rect.size
+            self._moving[row] = entity.body.body_type != Body.STATIC
+            self._collision_type[row] = entity.shape.collision_type
+            self._is_known[row] = True
+
+        self._moving_rows = np.flatnonzero(self._moving[:n])
+        self._moving_entities = [self._entities[row] for row in self._moving_rows.tolist()]
+        self._is_changed = False
+
+    # Rows of the entities with the collision type, as an index array
+    def rows_of(self, collision_type: int) -> "np.ndarray":
+        if self._is_changed:
+            self._refresh()
+        return np.flatnonzero(self._collision_type[:self.count] == collision_type)
+
+    # Place every moving sprite between its last two physics states, alpha is how far along
+    def sync(self, alpha: float, viewport: Viewport) -> int:
+        if self._is_changed:
+            self._refresh()
+
+        entities = self._moving_entities
+        if not entities:
+            return 0
+        rows = self._moving_rows
+
+        # A flat list of floats is the only per-entity work left on the Python side, the position
+        # is read from chipmunk directly as pymunk would build a Vec2d for it
+        flat = []
+        for entity in entities:
+            flat.extend(entity.prev_position)
+            flat.extend(body_position(entity.body))
+        states = np.array(flat).reshape(-1, 2, 2)
+        pos = states[:, 0] + (states[:, 1] - states[:, 0]) * alpha
+        self._pos[rows] = pos
+
+        # Bodies are placed by their bottom left corner, rects by their top left one
+        px = viewport.coords_to_px(pos)
+        x = px[:, 0]
+        y = px[:, 1] - self._rect[rows, 3]
+
+        rect = self._rect[rows]
+        dirty = (rect[:, 0] != x) | (rect[:, 1] != y)
+        self._dirty[rows] = dirty
+        if not dirty.any():
+            return 0
+
+        changed = np.flatnonzero(dirty)
+        self._rect[rows[changed], 0] = x[changed]
+        self._rect[rows[changed], 1] = y[changed]
+        for i, left, top in zip(changed.tolist(), x[changed].tolist(), y[changed].tolist()):
+            sprite = entities[i]
+            sprite.rect.topleft = (left, top)
+            sprite.dirty = 1
+        return len(changed)
@@ -3,6 +3,7 @@ from pygame import Surface
 from pygame.sprite import DirtySprite
 
 from scenes.common import RatioRect, RatioCoord, Button, render_text
+from system.assets import AssetKey, Assets
 from system.scenes import BaseScene, Scenes
 from system.screen import Screen
 
@@ -46,16 +47,23 @@ class BackButton(Button):
 
 class GameOverScene(BaseScene):
 
+    @classmethod
+    def assets(cls) -> list[AssetKey]:
+        size = Screen.instance().size
+        return [
+            ("resources/p1win.png", size, False),
+            ("resources/p2win.png", size, False),
+        ]
+
     def __init__(self, winner: str):
         super().__init__()
 
-        background: Surface
+        path: str
         if winner == "Player 1":
-            background = pygame.image.load("resources/p1win.png")
+            path = "resources/p1win.png"
         elif winner == "Player 2":
-            background = pygame.image.load("resources/p2win.png")
-        background = pygame.transform.scale(background, Screen.instance().size)
-        self.background = background
+            path = "resources/p2win.png"
+        self.background = Assets.instance().load(path, Screen.instance().size, False)
 
         self.sprites.add(BackButton())
 
@@ -1,30 +1,49 @@
-import pygame
+from typing import TYPE_CHECKING, Optional
 
+from system.assets import Assets
 from system.event_handler import EventHandler
 from system.scenes import BaseScene, Scenes
 from system.screen import Screen
 
+if TYPE_CHECKING:
+    from scenes.maps import WindowsMap
+
 
 class LoadingScene(BaseScene):
 
     def __init__(self):
         super().__init__()
 
-        background = pygame.image.load("resources/start.png")
-        background = pygame.transform.scale(background, Screen.instance().size)
-        self.background = background
+        from scenes.game_over_scene import GameOverScene
+        from scenes.play_scene import PlayScene
+        from scenes.title_scene import TitleScene
+
+        # The splash is the title's background, the scene that follows shows it already loaded
+        self.background = Assets.instance().load(*TitleScene.assets()[0])
+
+        # Read the rest of the game's images while the splash is shown
+        Scenes.instance().preload(TitleScene, PlayScene, GameOverScene)
+
+        # The first match's map, built once the splash is on screen
+        self.game_map: Optional["WindowsMap"] = None
+        self._is_rendered = False
 
     def update(self):
         super().update()
 
+        if self.game_map is None and self._is_rendered:
+            from scenes.play_scene import prebuild_map
+            self.game_map = prebuild_map()
+
         self.sprites.update()
 
         event_handler = EventHandler.instance()
         if event_handler.is_key_updated or event_handler.is_mouse_updated:
             from scenes.title_scene import TitleScene
             scenes = Scenes.instance()
-            scenes.change_scene(TitleScene())
+            scenes.change_scene(TitleScene(self.game_map))
 
     def render(self):
         screen = Screen.instance()
         screen.render(self.background, self.sprites)
+        self._is_rendered = True
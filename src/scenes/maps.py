@@ -1,6 +1,8 @@
 import abc
-from random import randrange
-from enum import Enum, auto
+from random import Random, getrandbits
+from enum import Enum, IntFlag, auto
+from itertools import count
+from typing import TYPE_CHECKING, NamedTuple, Optional
 
 import pygame
 from pygame import Rect, Surface
@@ -8,9 +10,18 @@ from pygame.sprite import DirtySprite, Group
 import pymunk
 from pymunk import Body, Poly, Space
 
-from system.clock import Clock, Timer
+from game_config import GameConfig
+from system.assets import AssetKey, Assets
+from system.clock import WALL_TIME, Clock, SimulationTime, Timer, TimeSource
 from system.event_handler import EventHandler
+from system.profiler import Profiler, profiled_callback
 from system.screen import Screen
+from scenes.chipmunk import (ContactCache, apply_position_bias, body_state, reserve_shapes, set_body_state,
+                             set_shape_id_counter, shape_id_counter)
+from scenes.entity_store import HAS_NUMPY, EntityStore
+
+if TYPE_CHECKING:
+    from scenes.replay import ReplayRecorder
 
 G = 980.665
 
@@ -33,17 +44,17 @@ height: 9m
 
 
 class Lenght:
+    __slots__ = ("x",)
 
     def __init__(self, x: float):
         self.x: float = x
 
     def to_px(self) -> int:
-        screen = Screen.instance()
-        pixel_per_coord = screen.width / 16 / 100
-        return round(self.x * pixel_per_coord)
+        return Screen.instance().viewport.length_to_px(self.x)
 
 
 class Size:
+    __slots__ = ("width", "height")
 
     def __init__(self, width: float, height: float):
         self.width = Lenght(width)
@@ -53,10 +64,11 @@ class Size:
         return (self.width.x, self.height.x)
 
     def to_px(self) -> tuple[int, int]:
-        return (self.width.to_px(), self.height.to_px())
+        return Screen.instance().viewport.size_to_px(self.width.x, self.height.x)
 
 
 class Coord:
+    __slots__ = ("x", "y")
 
     def __init__(self, x: float, y: float):
         self.x = Lenght(x)
@@ -66,19 +78,126 @@ class Coord:
         return (self.x.x, self.y.x)
 
     def to_px(self) -> tuple[int, int]:
-        screen = Screen.instance()
-        return (self.x.to_px(), screen.height - self.y.to_px())
+        return Screen.instance().viewport.coord_to_px(self.x.x, self.y.x)
 
 
 class CollisionTypes(Enum):
     GROUND = auto()
     PLAYER = auto()
     BULLET = auto()
+    WALL = auto()
+
+    @property
+    def category(self) -> int:
+        return 1 << self.value
+
+    def shape_filter(self) -> pymunk.ShapeFilter:
+        mask = pymunk.ShapeFilter.ALL_MASKS()
+
+        # Bullets never interact with each other, so let the broadphase drop the pair
+        if self == CollisionTypes.BULLET:
+            mask ^= CollisionTypes.BULLET.category
+
+        return pymunk.ShapeFilter(categories=self.category, mask=mask)
+
+
+class WeaponModes(Enum):
+    # Every shot is a bullet travelling through the map
+    PROJECTILE = auto()
+    # Every shot is resolved at once by a segment query, no body is created
+    HITSCAN = auto()
+
+
+HITSCAN_RANGE = 2000
+
+# Sides of the characters and of their bullets, in map coordinates
+CHARACTER_SIZE = 60
+BULLET_SIZE = 20
+
+
+# Buttons held during a physics step, packed so a step's input fits in 4 bits
+class Buttons(IntFlag):
+    JUMP = auto()
+    LEFT = auto()
+    RIGHT = auto()
+    ATTACK = auto()
+
+# Shapes sharing a filter group never collide, hitscan queries use the shooter's group to skip it
+_filter_groups = count(1)
+
+
+class EntityRegistry:
+
+    def __init__(self, store: Optional[EntityStore] = None):
+        self._entities: dict[pymunk.Shape, "Entity"] = {}
+        # Drawing rows of the registered entities, kept in step with them
+        self.store = store
+
+    def add(self, entity: "Entity"):
+        self._entities[entity.shape] = entity
+        if self.store is not None:
+            self.store.add(entity)
+
+    def remove(self, entity: "Entity"):
+        self._entities.pop(entity.shape, None)
+        if self.store is not None:
+            self.store.remove(entity)
+
+    def find(self, shape: pymunk.Shape) -> "Entity | None":
+        return self._entities.get(shape)
+
+    def __iter__(self):
+        return iter(self._entities.values())
+
+    # Iteration follows the order entities were added or moved in
+    def move_to_end(self, entity: "Entity"):
+        self._entities[entity.shape] = self._entities.pop(entity.shape)
+
+    def find_pair(self, shapes: tuple[pymunk.Shape, pymunk.Shape]) -> tuple["Entity | None", "Entity | None"]:
+        return (self._entities.get(shapes[0]), self._entities.get(shapes[1]))
+
+
+# Cell size and count of the spatial hash of the shapes, the cells are about as large as a character
+SPATIAL_HASH_DIM = 100
+SPATIAL_HASH_CELLS = 1000
+# Shapes the spatial hash makes room for up front, a match with more is no longer restored exactly
+RESERVED_SHAPES = 500
+
+
+class MapSpace(Space):
+
+    def __init__(self, seed: int):
+        super().__init__()
+        # The solver goes through the touching pairs in the order the broadphase finds them.
+        # A spatial hash finds them from the shapes' positions every step, where the default
+        # tree's order depends on how it was built up, which a snapshot can't carry. A tick costs
+        # the same with either up to a few hundred bullets and less with the hash past that
+        self.use_spatial_hash(SPATIAL_HASH_DIM, SPATIAL_HASH_CELLS)
+        reserve_shapes(self, RESERVED_SHAPES)
+
+        # Keep only the contacts of the last step, all a snapshot needs to carry
+        self.collision_persistence = 1
+        self.contacts = ContactCache(self)
+
+        # Owner of every shape in this space, used by the collision handlers.
+        # Nothing is drawn without a display, so there is no store to keep there
+        store = None
+        if HAS_NUMPY and not GameConfig.instance().headless:
+            store = EntityStore()
+        self.registry = EntityRegistry(store)
+
+        # Every random choice of the map, so a seed and the inputs reproduce a match
+        self.random = Random(seed)
+
+        # Time of the map's timers, advanced by BaseMap.fixed_update
+        self.time: TimeSource = SimulationTime()
+        if GameConfig.instance().timer_source == "wall":
+            self.time = WALL_TIME
 
 
 class Entity(DirtySprite):
 
-    def __init__(self, sprites: Group, space: Space, pos: Coord, size: Size):
+    def __init__(self, sprites: Group, space: MapSpace, pos: Coord, size: Size):
         super().__init__()
 
         self.sprites = sprites
@@ -86,12 +205,16 @@ class Entity(DirtySprite):
 
         self.sprites.add(self)
 
+        # Where the entity was built, the body holds where it is
         self.pos: Coord = pos
         self.size: Size = size
 
         self.body: Body = Body(2, float("inf"))
         self.body.position = self.pos.to_tuple()
 
+        # Position at the start of the last physics step, drawn positions are interpolated from it
+        self.prev_position = self.body.position
+
         width = self.size.width.x
         height = self.size.height.x
 
@@ -107,14 +230,23 @@ class Entity(DirtySprite):
         self.shape.elasticity = 0.5
 
         space.add(self.body, self.shape)
+        space.registry.add(self)
 
-        self.rect = Rect(self.pos.to_px(), self.size.to_px())
+        self.rect = Rect((0, 0), self.size.to_px())
+        self.rect.bottomleft = self.pos.to_px()
 
         surface = Surface(self.rect.size)
         surface.fill("purple")
 
         self.image = surface
 
+        # Static entities are drawn into the map background by BaseMap.bake_static
+        self.bakeable = True
+
+    def set_collision_type(self, collision_type: CollisionTypes):
+        self.shape.collision_type = collision_type.value
+        self.shape.filter = collision_type.shape_filter()
+
     def apply_force(self, force: tuple[int, int]):
         self.body.apply_force_at_local_point(force, self.body.center_of_gravity)
 
@@ -133,17 +265,57 @@ class Entity(DirtySprite):
                         other: "Entity"):
         pass
 
+    def teleport(self, position: tuple[float, float]):
+        self.body.position = position
+        # Don't interpolate across the jump
+        self.prev_position = self.body.position
+
+    # Taken between physics steps, when no force is pending, and bodies never rotate
+    def snapshot(self) -> tuple:
+        return (body_state(self.body), self.prev_position)
+
+    def restore(self, state: tuple):
+        body, self.prev_position = state
+        set_body_state(self.body, body)
+
+    # Called once per physics step, before the space is stepped
+    def fixed_update(self):
+        self.prev_position = self.body.position
+
+    # Called once per rendered frame
     def update(self):
+        # Static bodies never move, so there is nothing to sync,
+        # and with a store BaseMap.sync_sprites places every entity at once
+        if self.space.registry.store is not None or self.body.body_type == Body.STATIC:
+            return
+
+        alpha = Clock.instance().alpha()
+        position = self.prev_position.interpolate_to(self.body.position, alpha)
+
         self.dirty = 1
-        self.pos = Coord(self.body.position[0], self.body.position[1])
-        self.rect.bottomleft = self.pos.to_px()
+        self.rect.bottomleft = Screen.instance().viewport.coord_to_px(position.x, position.y)
+
+
+# Simulation state of a map between two physics steps, entities are kept by reference
+class MapSnapshot(NamedTuple):
+    ticks: int
+    shape_ids: int
+    random: tuple
+    entities: tuple[tuple["Entity", tuple], ...]
+    pools: tuple[tuple, ...]
+    bullet_field: Optional[tuple]
+    contacts: tuple
 
 
 class BaseMap:
 
-    def __init__(self, sprites: Group):
+    def __init__(self, sprites: Group, seed: Optional[int] = None):
+        if seed is None:
+            seed = getrandbits(32)
+
+        self.seed = seed
         self.sprites: Group = sprites
-        self.space = Space()
+        self.space = MapSpace(seed)
         self.space.gravity = (0, -G)
 
         self.background = Surface(Screen.instance().size)
@@ -159,54 +331,201 @@ class BaseMap:
             Entity(self.sprites, self.space, Coord(width, 0), Size(thickness, height)),
         ]
 
-        borders[0].shape.collision_type = CollisionTypes.GROUND.value
+        borders[0].set_collision_type(CollisionTypes.GROUND)
+        for border in borders[1:]:
+            border.set_collision_type(CollisionTypes.WALL)
+
         for border in borders:
             border.body.body_type = Body.STATIC
             border.shape.elasticity = 1
             border.shape.friction = 0
 
-        def find_entities(shapes: tuple[pymunk.Shape, pymunk.Shape]) -> list[Entity]:
-            ret = []
-            for i in self.sprites:
-                if (hasattr(i, "shape")
-                    and (i.shape is shapes[0]
-                    or i.shape is shapes[1])):
-                    ret.append(i)
+        registry = self.space.registry
+
+        # The handlers are registered as (a, b), so arbiter.shapes is ordered the same way
+        def bullet_player_begin(arbiter: pymunk.Arbiter, space: Space, data) -> bool:
+            bullet, player = registry.find_pair(arbiter.shapes)
+            if bullet is None or player is None:
+                return True
+
+            return (bullet.collision_begin(arbiter, space, player)
+                    and player.collision_begin(arbiter, space, bullet))
+
+        def bullet_world_begin(arbiter: pymunk.Arbiter, space: Space, data) -> bool:
+            bullet, world = registry.find_pair(arbiter.shapes)
+            if bullet is None or world is None:
+                return True
 
-            return ret
+            return bullet.collision_begin(arbiter, space, world)
 
-        def default_begin_handler(arbiter: pymunk.Arbiter, space: Space, data) -> bool:
-            entities = find_entities(arbiter.shapes)
-            if len(entities) != 2:
+        def player_ground_begin(arbiter: pymunk.Arbiter, space: Space, data) -> bool:
+            player, ground = registry.find_pair(arbiter.shapes)
+            if player is None or ground is None:
                 return True
 
-            ok = True
-            ok = ok and entities[0].collision_begin(arbiter, space, entities[1])
-            ok = ok and entities[1].collision_begin(arbiter, space, entities[0])
-            return ok
+            return player.collision_begin(arbiter, space, ground)
 
-        def default_end_handler(arbiter: pymunk.Arbiter, space: Space, data):
-            entities = find_entities(arbiter.shapes)
-            if len(entities) != 2:
+        def player_ground_separate(arbiter: pymunk.Arbiter, space: Space, data):
+            player, ground = registry.find_pair(arbiter.shapes)
+            if player is None or ground is None:
                 return
 
-            entities[0].collision_end(arbiter, space, entities[1])
-            entities[1].collision_end(arbiter, space, entities[0])
+            player.collision_end(arbiter, space, ground)
 
-        handler = self.space.add_default_collision_handler()
-        handler.begin = default_begin_handler
-        handler.separate = default_end_handler
+        # Pairs without a handler (player-player, player-wall) are plain physics,
+        # and bullet-bullet pairs are rejected by the shape filters
+        handler = self.space.add_collision_handler(
+            CollisionTypes.BULLET.value, CollisionTypes.PLAYER.value)
+        handler.begin = profiled_callback(bullet_player_begin)
+
+        bullet_world_begin = profiled_callback(bullet_world_begin)
+        for world in (CollisionTypes.GROUND, CollisionTypes.WALL):
+            handler = self.space.add_collision_handler(
+                CollisionTypes.BULLET.value, world.value)
+            handler.begin = bullet_world_begin
+
+        handler = self.space.add_collision_handler(
+            CollisionTypes.PLAYER.value, CollisionTypes.GROUND.value)
+        handler.begin = profiled_callback(player_ground_begin)
+        handler.separate = profiled_callback(player_ground_separate)
 
         self.player1: Character
         self.player2: Character
 
+        # Set when bullets are simulated by the NumPy bullet field instead of pymunk
+        self.bullet_field = None
+
+        # Set to write the inputs of every step to a replay
+        self.recorder: Optional["ReplayRecorder"] = None
+
+    # Draw static entities into the background once and drop their sprites,
+    # their shapes stay in the space
+    def bake_static(self):
+        background = self.background.copy()
+
+        for entity in self.space.registry:
+            if entity.body.body_type != Body.STATIC or not entity.bakeable:
+                continue
+
+            if entity.visible:
+                background.blit(entity.image, entity.rect)
+            self.sprites.remove(entity)
+
+        self.background = background
+
+    # Everything a physics step reads, static entities never change so they are skipped
+    def snapshot(self) -> MapSnapshot:
+        assert isinstance(self.space.time, SimulationTime), "Snapshots need the simulation timer source"
+
+        return MapSnapshot(
+            self.space.time.ticks,
+            shape_id_counter(self.space),
+            self.space.random.getstate(),
+            tuple((entity, entity.snapshot())
+                  for entity in self.space.registry
+                  if entity.body.body_type != Body.STATIC),
+            (self.player1.bullets.snapshot(), self.player2.bullets.snapshot()),
+            self.bullet_field.snapshot() if self.bullet_field is not None else None,
+            self.space.contacts.snapshot(),
+        )
+
+    # Puts the map back in the state of the snapshot, the steps after it play out as they did
+    def restore(self, snapshot: MapSnapshot):
+        self.space.time.ticks = snapshot.ticks
+        self.space.random.setstate(snapshot.random)
+
+        # Before any shape leaves, so the contacts of the abandoned steps end without callbacks
+        self.space.contacts.restore(snapshot.contacts)
+
+        # Bullets fired after the snapshot go back to their pool, restore() brings back the others
+        live = {entity for entity, _ in snapshot.entities}
+        for entity in list(self.space.registry):
+            if isinstance(entity, Bullet) and entity not in live:
+                entity.despawn()
+
+        self.player1.bullets.restore(snapshot.pools[0])
+        self.player2.bullets.restore(snapshot.pools[1])
+        # Bullets the pools build again get the ids they had
+        set_shape_id_counter(self.space, snapshot.shape_ids)
+
+        registry = self.space.registry
+        for entity, state in snapshot.entities:
+            entity.restore(state)
+            registry.move_to_end(entity)
+
+        if self.bullet_field is not None:
+            self.bullet_field.restore(snapshot.bullet_field)
+
+    # Called once per rendered frame, before the physics steps
     def update(self):
-        clock = Clock.instance()
-        self.space.step(clock.delta_sec())
+        self.player1.input.poll()
+        self.player2.input.poll()
+
+    # Called once per rendered frame after the physics steps, places the moving sprites
+    # at their interpolated positions when the entities are in a store
+    def sync_sprites(self):
+        store = self.space.registry.store
+        if store is None:
+            return
+
+        store.sync(Clock.instance().alpha(), Screen.instance().viewport)
+
+    # Bullets flying, counted one by one unless the bullet field has them
+    def live_bullets(self) -> int:
+        if self.bullet_field is not None:
+            return self.bullet_field.count
+        return sum(isinstance(entity, Bullet) for entity in self.space.registry)
+
+    # Called once per physics step
+    def fixed_update(self):
+        for entity in list(self.space.registry):
+            if entity.body.body_type != Body.STATIC:
+                entity.fixed_update()
+
+        if self.recorder is not None:
+            self.recorder.record(self.player1.buttons, self.player2.buttons)
+
+        dt = Clock.instance().delta_sec()
+        profiler = Profiler.instance()
+        start = profiler.start()
+        self.space.step(dt)
+        for entity in self.space.registry:
+            if entity.body.body_type == Body.DYNAMIC:
+                apply_position_bias(entity.body, dt)
+        profiler.stop("physics", start)
+
+        if self.bullet_field is not None:
+            start = profiler.start()
+            self.bullet_field.step(dt)
+            profiler.stop("physics", start)
+
+        if isinstance(self.space.time, SimulationTime):
+            self.space.time.advance()
 
 
 class BaseInput(abc.ABC):
 
+    # Called by the character using this input, once it is built
+    def bind(self, character: "Character"):
+        pass
+
+    # Called once per rendered frame, a frame may run zero or several physics steps
+    def poll(self):
+        pass
+
+    # Called once per physics step, every button is asked so a jump press is always consumed
+    def buttons(self) -> int:
+        buttons = 0
+        if self.jump():
+            buttons |= Buttons.JUMP
+        if self.left():
+            buttons |= Buttons.LEFT
+        if self.right():
+            buttons |= Buttons.RIGHT
+        if self.basic_attack():
+            buttons |= Buttons.ATTACK
+        return int(buttons)
+
     @abc.abstractmethod
     def jump(self) -> bool:
         pass
@@ -224,39 +543,175 @@ class BaseInput(abc.ABC):
         pass
 
 
+def zero_gravity(body: Body, gravity: tuple[float, float], damping: float, dt: float):
+    Body.update_velocity(body, (0, 0), damping, dt)
+
+
+# Bullets out of play wait below the map, each a couple of spatial hash cells from the last
+BULLET_PARKING_X = -10_000
+BULLET_PARKING_Y = -10_000
+
+
 class Bullet(Entity):
 
-    def __init__(self, sprites: Group, space: Space, owner: Entity, pos: Coord, damage: float, img: Surface):
-        super().__init__(sprites, space, pos, Size(20, 20))
+    # Built by its owner's pool, the index in the pool decides where the bullet is parked
+    def __init__(self, sprites: Group, space: Space, owner: "Character", pool: "BulletPool", index: int):
+        parking = Coord(BULLET_PARKING_X - index * 2 * SPATIAL_HASH_DIM, BULLET_PARKING_Y)
+        super().__init__(sprites, space, parking, Size(BULLET_SIZE, BULLET_SIZE))
         self.owner = owner
-        self.damage = damage
+        self.pool = pool
+        self.damage = owner.bullet_damage
+        self.active = True
 
         self.body.mass = 1
-        self.shape.collision_type = CollisionTypes.BULLET.value
+        self.set_collision_type(CollisionTypes.BULLET)
+        # In the owner's group, so it passes through its shooter like hitscan shots and field bullets do
+        self.shape.filter = self.shape.filter._replace(group=owner._filter_group)
+
+        self.body.velocity_func = zero_gravity
 
+    def spawn(self, pos: Coord, damage: float, img: Surface):
+        self.damage = damage
         self.image = img
 
-        def zero_gravity(body, gravity, damping, dt):
-            Body.update_velocity(body, (0, 0), damping, dt)
-        self.body.velocity_func = zero_gravity
+        self._place(pos.to_tuple())
+
+        self.space.registry.add(self)
+        self.sprites.add(self)
+        self.active = True
+
+        super().update()
+
+    def _place(self, position: tuple[float, float]):
+        self.teleport(position)
+        self.body.velocity = (0, 0)
+        self.body.force = (0, 0)
+        # The body keeps the solver's position correction of its last step, a step of 0 clears it
+        Body.update_position(self.body, 0)
+
+    # The bullet stays in the space, parked where it was built, so the broadphase keeps finding
+    # the shapes in the order they were added
+    def despawn(self):
+        if not self.active:
+            return
+        self.active = False
 
+        self._place(self.pos.to_tuple())
+        self.space.registry.remove(self)
+        self.sprites.remove(self)
+
+        self.pool.release(self)
+
+    # The shape filter keeps the owner out, so anything a bullet touches ends it
     def collision_begin(self, arbiter: pymunk.Arbiter, space: Space, other: Entity) -> bool:
-        if other.shape.collision_type != CollisionTypes.BULLET.value and other is not self.owner:
-            self.space.remove(self.shape, self.body)
-            self.sprites.remove(self)
+        # The space can't be modified in the middle of a step
+        space.add_post_step_callback(self._despawn_after_step, self)
+        return True
+
+    def _despawn_after_step(self, space: Space, key: "Bullet"):
+        self.despawn()
+
+    def snapshot(self) -> tuple:
+        return (super().snapshot(), self.damage)
+
+    # Only live bullets are in a snapshot, so a parked one is brought back
+    def restore(self, state: tuple):
+        entity_state, self.damage = state
+        if not self.active:
+            self.space.registry.add(self)
+            self.sprites.add(self)
+            self.active = True
+        super().restore(entity_state)
+
+
+class BulletPool:
+
+    def __init__(self, owner: "Character"):
+        self.owner = owner
+        # Every bullet built, in order, the first count of them are in the space
+        self._bullets: list[Bullet] = []
+        self._count = 0
+        # Parked bullets, the last one released is fired next
+        self._free: list[Bullet] = []
+
+    def fire(self, pos: Coord) -> Bullet:
+        owner = self.owner
+
+        if self._free:
+            bullet = self._free.pop()
+        else:
+            if self._count == len(self._bullets):
+                self._bullets.append(Bullet(owner.sprites, owner.space, owner, self, self._count))
+            else:
+                # Taken out by a restore, it joins the space again where it first did
+                bullet = self._bullets[self._count]
+                owner.space.add(bullet.body, bullet.shape)
+            bullet = self._bullets[self._count]
+            self._count += 1
+
+        bullet.spawn(pos, owner.bullet_damage, owner.bullet_img)
+        return bullet
+
+    def release(self, bullet: Bullet):
+        self._free.append(bullet)
+
+    # The free list order decides which bullet is reused next
+    def snapshot(self) -> tuple[int, tuple[Bullet, ...]]:
+        return (self._count, tuple(self._free))
+
+    # Bullets built after the snapshot leave the space, they are parked by then
+    def restore(self, state: tuple[int, tuple[Bullet, ...]]):
+        count, free = state
+        assert count <= self._count, "Snapshots are restored on the way back only"
+        space = self.owner.space
+        for bullet in self._bullets[count:self._count]:
+            space.remove(bullet.shape, bullet.body)
+
+        self._count = count
+        self._free = list(free)
+
+
+class Impact(DirtySprite):
+
+    def __init__(self, sprites: Group, time: TimeSource):
+        super().__init__()
 
-        if other.shape.collision_type == CollisionTypes.PLAYER.value:
-            return True
+        self.sprites = sprites
+        self.sprites.add(self)
+
+        self.visible = 0
+        self.image = Surface((0, 0))
+        self.rect = self.image.get_rect()
+
+        self.timer = Timer(80, time)
+
+    def show(self, pos: Coord, img: Surface):
+        self.dirty = 1
+        self.visible = 1
+        self.image = img
+        self.rect = img.get_rect(center=pos.to_px())
+        self.timer.start()
 
-        return False
+    def update(self):
+        if self.timer.over():
+            self.timer.stop()
+            self.dirty = 1
+            self.visible = 0
 
 
 class Character(Entity):
 
     def __init__(self, sprites: Group, space: Space, pos: Coord, my_input: BaseInput):
-        super().__init__(sprites, space, pos, Size(60, 60))
-        self.shape.collision_type = CollisionTypes.PLAYER.value
+        super().__init__(sprites, space, pos, Size(CHARACTER_SIZE, CHARACTER_SIZE))
+        self.set_collision_type(CollisionTypes.PLAYER)
         self.input = my_input
+        # Buttons of the last physics step
+        self.buttons = 0
+        # Shots fired since the match started
+        self.shots = 0
+
+        self._filter_group = next(_filter_groups)
+        self.shape.filter = self.shape.filter._replace(group=self._filter_group)
 
         self.full_hp: float = 100.0
         self.hp: float = 100.0
@@ -269,57 +724,147 @@ class Character(Entity):
         self.bullet_damage = 10
         self.bullet_impulse = 1500
 
-        self.bullet_interval = Timer(1 / (self.rpm / 60) * 1000)
+        self.bullet_interval = Timer(1 / (self.rpm / 60) * 1000, self.space.time)
         self.bullet_interval.start()
 
         self.bullet_img = Surface(self.rect.size)
+        self.bullets = BulletPool(self)
+        self.bullet_field = None
+
+        self.weapon_mode = WeaponModes.PROJECTILE
+        self._impact: Impact | None = None
 
-        self._grounded_cnt = 0
+        # Drawn for a moment after every hit instead of the character's image, both set by the subclasses
+        self._img = self.image
+        self._img_hitted = self.image
+        self._hitted_timer = Timer(100, self.space.time)
+
+        # Ground entities touching the character, a set so a repeated begin can't count twice
+        self._grounds: set[Entity] = set()
         self._dir = 1
 
+        self.input.bind(self)
 
     def collision_begin(self, arbiter: pymunk.Arbiter, space: Space, other: Entity) -> True:
         if other.shape.collision_type == CollisionTypes.GROUND.value:
-            self._grounded_cnt += 1
+            self._grounds.add(other)
 
         if other.shape.collision_type == CollisionTypes.BULLET.value:
-            self.hp -= other.damage
+            self.hit(other.damage)
 
         return True
 
-    def collision_end(self, arbiter: pymunk.Arbiter, space: Space, other: Entity):
-        if other.shape.collision_type == CollisionTypes.GROUND.value:
-            self._grounded_cnt -= 1
+    def hit(self, damage: float):
+        self._hitted_timer.start()
+        self.image = self._img_hitted
+        self.dirty = 1
+
+        self.hp -= damage
+
+    def snapshot(self) -> tuple:
+        return (super().snapshot(), self.hp, tuple(self._grounds), self._dir, self.buttons,
+                self.bullet_interval.snapshot(), self.shots, self._hitted_timer.snapshot())
+
+    def restore(self, state: tuple):
+        entity_state, self.hp, grounds, self._dir, self.buttons, interval, self.shots, hitted = state
+        super().restore(entity_state)
+        self._grounds = set(grounds)
+        self.bullet_interval.restore(interval)
+        self._hitted_timer.restore(hitted)
+        self.image = self._img_hitted if self._hitted_timer.is_activate else self._img
+        self.dirty = 1
 
     def update(self):
+        if self._hitted_timer.over():
+            self._hitted_timer.stop()
+            self.image = self._img
+            self.dirty = 1
         super().update()
 
-        if self._grounded_cnt > 0 and self.input.jump():
+    def collision_end(self, arbiter: pymunk.Arbiter, space: Space, other: Entity):
+        if other.shape.collision_type == CollisionTypes.GROUND.value:
+            self._grounds.discard(other)
+
+    def fixed_update(self):
+        super().fixed_update()
+
+        # Sampled once, so a press made in the air is consumed rather than kept for the landing
+        buttons = self.input.buttons()
+        self.buttons = buttons
+
+        if self._grounds and buttons & Buttons.JUMP:
             self.apply_impulse((0, self.jump))
 
-        if -self.limit_speed < self.body.velocity.x and self.input.left():
+        if -self.limit_speed < self.body.velocity.x and buttons & Buttons.LEFT:
             self.apply_force((-self.speed, 0))
             self._dir = -1
 
-        if self.body.velocity.x < self.limit_speed and self.input.right():
+        if self.body.velocity.x < self.limit_speed and buttons & Buttons.RIGHT:
             self.apply_force((self.speed, 0))
             self._dir = 1
 
-        if self.bullet_interval.over() and self.input.basic_attack():
-            pos = self.pos
+        if self.bullet_interval.over() and buttons & Buttons.ATTACK:
+            pos = Coord(self.body.position.x, self.body.position.y)
             if self._dir < 0:
                 pos.x.x -= 10
             elif self._dir > 0:
                 pos.x.x += 50
             pos.y.x += self.size.height.x / 2 - 10
-            bullet = Bullet(self.sprites, self.space, self, pos, self.bullet_damage, self.bullet_img)
-            bullet.apply_impulse((self.bullet_impulse * self._dir, 0))
+            self.fire(pos)
 
             self.bullet_interval.start()
 
 
+    def fire(self, pos: Coord):
+        self.shots += 1
+
+        if self.weapon_mode == WeaponModes.HITSCAN:
+            self.fire_hitscan(pos)
+            return
+
+        if self.bullet_field is not None:
+            # Bullets have a mass of 1, so the impulse is also their velocity
+            self.bullet_field.fire(self, pos, (self.bullet_impulse * self._dir, 0))
+            return
+
+        bullet = self.bullets.fire(pos)
+        bullet.apply_impulse((self.bullet_impulse * self._dir, 0))
+
+
+    def fire_hitscan(self, pos: Coord):
+        half = BULLET_SIZE / 2
+        start = (pos.x.x + half, pos.y.x + half)
+        end = (start[0] + HITSCAN_RANGE * self._dir, start[1])
+
+        # Query as if it were a bullet of this character, so it skips the shooter and bullets
+        shape_filter = CollisionTypes.BULLET.shape_filter()._replace(group=self._filter_group)
+
+        info = self.space.segment_query_first(start, end, half, shape_filter)
+        if info is None:
+            return
+
+        other = self.space.registry.find(info.shape)
+        if other is not None and other.shape.collision_type == CollisionTypes.PLAYER.value:
+            other.hit(self.bullet_damage)
+            # Bullets have a mass of 1, so the impulse is what a bullet would carry
+            other.apply_impulse((self.bullet_impulse * self._dir, 0))
+
+        if self._impact is None:
+            self._impact = Impact(self.sprites, self.space.time)
+        self._impact.show(Coord(info.point.x, info.point.y), self.bullet_img)
+
+
 class CppCharacter(Character):
 
+    @classmethod
+    def assets(cls) -> list[AssetKey]:
+        size = Size(CHARACTER_SIZE, CHARACTER_SIZE).to_px()
+        return [
+            ("resources/c_bullet.png", Size(BULLET_SIZE, BULLET_SIZE).to_px(), True),
+            ("resources/c.png", size, True),
+            ("resources/c_hitted.png", size, True),
+        ]
+
     def __init__(self, sprites: Group, space: Space, pos: Coord, my_input: BaseInput):
         super().__init__(sprites, space, pos, my_input)
         self.body.mass = 2.5
@@ -332,37 +877,29 @@ class CppCharacter(Character):
         self.bullet_impulse = 2000
         self.bullet_damage = 7.5
 
-        self.bullet_interval = Timer(1 / (self.rpm / 60) * 1000)
+        self.bullet_interval = Timer(1 / (self.rpm / 60) * 1000, self.space.time)
         self.bullet_interval.start()
 
-        self.bullet_img = pygame.image.load("resources/c_bullet.png")
-        self.bullet_img = pygame.transform.scale(self.bullet_img, Size(20, 20).to_px())
+        bullet_img, img, img_hitted = (Assets.instance().load(*key) for key in self.assets())
 
-        self._hitted_timer = Timer(100)
+        self.bullet_img = bullet_img
 
-        self._img = pygame.image.load("resources/c.png").convert_alpha()
-        self._img = pygame.transform.scale(self._img, (self.rect.width, self.rect.height))
-
-        self._img_hitted = pygame.image.load("resources/c_hitted.png").convert_alpha()
-        self._img_hitted = pygame.transform.scale(self._img_hitted, (self.rect.width, self.rect.height))
+        self._img = img
+        self._img_hitted = img_hitted
         self.image = self._img
 
-    def collision_begin(self, arbiter: pymunk.Arbiter, space: Space, other: Entity) -> True:
-        if other.shape.collision_type == CollisionTypes.BULLET.value:
-            self._hitted_timer.start()
-            self.image = self._img_hitted
-
-        return super().collision_begin(arbiter, space, other)
-
-    def update(self):
-        if self._hitted_timer.over():
-            self._hitted_timer.stop()
-            self.image = self._img
-        super().update()
-
 
 class PythonCharacter(Character):
 
+    @classmethod
+    def assets(cls) -> list[AssetKey]:
+        size = Size(CHARACTER_SIZE, CHARACTER_SIZE).to_px()
+        return [
+            ("resources/python_bullet.png", Size(BULLET_SIZE, BULLET_SIZE).to_px(), True),
+            ("resources/python.png", size, True),
+            ("resources/python_hitted.png", size, True),
+        ]
+
     def __init__(self, sprites: Group, space: Space, pos: Coord, my_input: BaseInput):
         super().__init__(sprites, space, pos, my_input)
         self.body.mass = 1.5
@@ -374,91 +911,94 @@ class PythonCharacter(Character):
 
         self.bullet_impulse = 1000
         self.bullet_damage = 1.5
-        self.bullet_interval = Timer(1 / (self.rpm / 60) * 1000)
+        self.bullet_interval = Timer(1 / (self.rpm / 60) * 1000, self.space.time)
         self.bullet_interval.start()
 
-        self.bullet_img = pygame.image.load("resources/python_bullet.png")
-        self.bullet_img = pygame.transform.scale(self.bullet_img, Size(20, 20).to_px())
-
-        self._hitted_timer = Timer(100)
+        bullet_img, img, img_hitted = (Assets.instance().load(*key) for key in self.assets())
 
-        self._img = pygame.image.load("resources/python.png").convert_alpha()
-        self._img = pygame.transform.scale(self._img, (self.rect.width, self.rect.height))
+        self.bullet_img = bullet_img
 
-        self._img_hitted = pygame.image.load("resources/python_hitted.png").convert_alpha()
-        self._img_hitted = pygame.transform.scale(self._img_hitted, (self.rect.width, self.rect.height))
+        self._img = img
+        self._img_hitted = img_hitted
 
         self.image = self._img
 
-    def collision_begin(self, arbiter: pymunk.Arbiter, space: Space, other: Entity) -> True:
-        if other.shape.collision_type == CollisionTypes.BULLET.value:
-            self._hitted_timer.start()
-            self.image = self._img_hitted
 
-        return super().collision_begin(arbiter, space, other)
+class KeyboardInput(BaseInput):
 
-    def update(self):
-        if self._hitted_timer.over():
-            self._hitted_timer.stop()
-            self.image = self._img
-        super().update()
+    def __init__(self, jump_key: int, left_key: int, right_key: int, attack_key: int):
+        self.event_handler = EventHandler.instance()
 
+        self.jump_key = jump_key
+        self.left_key = left_key
+        self.right_key = right_key
+        self.attack_key = attack_key
 
-class P1Input(BaseInput):
+        self._jump = False
 
-    def __init__(self):
-        self.event_handler = EventHandler.instance()
+    def poll(self):
+        # Keep the press until a physics step consumes it
+        self._jump = self._jump or self.event_handler.is_key_down[self.jump_key]
 
     def jump(self) -> bool:
-        return self.event_handler.is_key_down[pygame.K_w]
+        jump = self._jump
+        self._jump = False
+        return jump
 
     def left(self) -> bool:
-        return self.event_handler.is_key_pressing[pygame.K_a]
+        return self.event_handler.is_key_pressing[self.left_key]
 
     def right(self) -> bool:
-        return self.event_handler.is_key_pressing[pygame.K_d]
+        return self.event_handler.is_key_pressing[self.right_key]
 
     def basic_attack(self) -> bool:
-        return self.event_handler.is_key_pressing[pygame.K_s]
+        return self.event_handler.is_key_pressing[self.attack_key]
 
 
-class P2Input(BaseInput):
+class P1Input(KeyboardInput):
 
     def __init__(self):
-        self.event_handler = EventHandler.instance()
+        super().__init__(pygame.K_w, pygame.K_a, pygame.K_d, pygame.K_s)
 
-    def jump(self) -> bool:
-        return self.event_handler.is_key_down[pygame.K_UP]
 
-    def left(self) -> bool:
-        return self.event_handler.is_key_pressing[pygame.K_LEFT]
+class P2Input(KeyboardInput):
 
-    def right(self) -> bool:
-        return self.event_handler.is_key_pressing[pygame.K_RIGHT]
+    def __init__(self):
+        super().__init__(pygame.K_UP, pygame.K_LEFT, pygame.K_RIGHT, pygame.K_DOWN)
 
-    def basic_attack(self) -> bool:
-        return self.event_handler.is_key_pressing[pygame.K_DOWN]
+
+# Where the start menu and the calendar rest and how they move, in map coordinates
+START_MENU_WIDTH = 500
+START_MENU_HEIGHT = 1000
+CALENDAR_X = 1600
+CALENDAR_Y = 75
+CALENDAR_WIDTH = 300
+CALENDAR_HEIGHT = 400
+CALENDAR_SPEED = 1000
+CALENDAR_PUSH_MS = 300
 
 
 class StartMenu(Entity):
 
+    @classmethod
+    def assets(cls) -> list[AssetKey]:
+        return [("resources/startmenu.png", Size(START_MENU_WIDTH, START_MENU_HEIGHT).to_px(), True)]
+
     def __init__(self, sprites: Group, space: Space):
-        super().__init__(sprites, space, Coord(0, -1000), Size(500, 1000))
+        super().__init__(sprites, space, Coord(0, -START_MENU_HEIGHT), Size(START_MENU_WIDTH, START_MENU_HEIGHT))
 
-        self.shape.collision_type = CollisionTypes.GROUND.value
+        self.set_collision_type(CollisionTypes.GROUND)
         self.body.body_type = Body.KINEMATIC
 
-        img = pygame.image.load("resources/startmenu.png").convert_alpha()
-        img = pygame.transform.scale(img, (self.rect.width, self.rect.height))
-        self.image = img
+        self.image = Assets.instance().load(*self.assets()[0])
 
-        t = randrange(3_000, 10_000)
-        self.timer = Timer(t)
+        t = self.space.random.randrange(3_000, 10_000)
+        self.timer = Timer(t, self.space.time)
         self.timer.start()
 
-        self.up_timer = Timer(500)
-        self.stop_timer = Timer(1000)
-        self.down_timer = Timer(500)
+        self.up_timer = Timer(500, self.space.time)
+        self.stop_timer = Timer(1000, self.space.time)
+        self.down_timer = Timer(500, self.space.time)
 
         self.states = {
             "stop": 1,
@@ -477,8 +1017,21 @@ class StartMenu(Entity):
                 body.velocity = (0, -1200)
         self.body.velocity_func = move
 
-    def update(self):
-        super().update()
+    # The velocity function reads self.state, so restoring it is enough
+    def snapshot(self) -> tuple:
+        return (super().snapshot(), self.state, self.timer.snapshot(), self.up_timer.snapshot(),
+                self.stop_timer.snapshot(), self.down_timer.snapshot())
+
+    def restore(self, state: tuple):
+        entity_state, self.state, timer, up, stop, down = state
+        super().restore(entity_state)
+        self.timer.restore(timer)
+        self.up_timer.restore(up)
+        self.stop_timer.restore(stop)
+        self.down_timer.restore(down)
+
+    def fixed_update(self):
+        super().fixed_update()
 
         if self.timer.over():
             self.timer.start()
@@ -498,28 +1051,30 @@ class StartMenu(Entity):
         if self.down_timer.over():
             self.down_timer.stop()
             self.state = self.states["stop"]
-            self.body.position = (0, -1000)
+            self.teleport((0, -START_MENU_HEIGHT))
 
 
 class Calendar(Entity):
 
+    @classmethod
+    def assets(cls) -> list[AssetKey]:
+        return [("resources/calender.png", Size(CALENDAR_WIDTH, CALENDAR_HEIGHT).to_px(), True)]
+
     def __init__(self, sprites: Group, space: Space):
-        super().__init__(sprites, space, Coord(1600, 75), Size(300, 400))
+        super().__init__(sprites, space, Coord(CALENDAR_X, CALENDAR_Y), Size(CALENDAR_WIDTH, CALENDAR_HEIGHT))
 
-        self.shape.collision_type = CollisionTypes.GROUND.value
+        self.set_collision_type(CollisionTypes.GROUND)
         self.body.body_type = Body.KINEMATIC
 
-        img = pygame.image.load("resources/calender.png").convert_alpha()
-        img = pygame.transform.scale(img, (self.rect.width, self.rect.height))
-        self.image = img
+        self.image = Assets.instance().load(*self.assets()[0])
 
-        t = randrange(3_000, 10_000)
-        self.timer = Timer(t)
+        t = self.space.random.randrange(3_000, 10_000)
+        self.timer = Timer(t, self.space.time)
         self.timer.start()
 
-        self.push_timer = Timer(300)
-        self.stop_timer = Timer(1_000)
-        self.pull_timer = Timer(300)
+        self.push_timer = Timer(CALENDAR_PUSH_MS, self.space.time)
+        self.stop_timer = Timer(1_000, self.space.time)
+        self.pull_timer = Timer(CALENDAR_PUSH_MS, self.space.time)
 
         self.states = {
             "stop": 1,
@@ -533,13 +1088,26 @@ class Calendar(Entity):
             if self.state == self.states["stop"]:
                 body.velocity = (0, 0)
             elif self.state == self.states["push"]:
-                body.velocity = (-1000, 0)
+                body.velocity = (-CALENDAR_SPEED, 0)
             elif self.state == self.states["pull"]:
-                body.velocity = (1000, 0)
+                body.velocity = (CALENDAR_SPEED, 0)
         self.body.velocity_func = move
 
-    def update(self):
-        super().update()
+    # The velocity function reads self.state, so restoring it is enough
+    def snapshot(self) -> tuple:
+        return (super().snapshot(), self.state, self.timer.snapshot(), self.push_timer.snapshot(),
+                self.stop_timer.snapshot(), self.pull_timer.snapshot())
+
+    def restore(self, state: tuple):
+        entity_state, self.state, timer, push, stop, pull = state
+        super().restore(entity_state)
+        self.timer.restore(timer)
+        self.push_timer.restore(push)
+        self.stop_timer.restore(stop)
+        self.pull_timer.restore(pull)
+
+    def fixed_update(self):
+        super().fixed_update()
 
         if self.timer.over():
             self.timer.start()
@@ -559,20 +1127,25 @@ class Calendar(Entity):
         if self.pull_timer.over():
             self.pull_timer.stop()
             self.state = self.states["stop"]
-            self.body.position = (1600, 75)
+            self.teleport((CALENDAR_X, CALENDAR_Y))
 
 
 class Taskbar(Entity):
 
+    @classmethod
+    def assets(cls) -> list[AssetKey]:
+        return [("resources/taskbar.png", Size(1600, 50).to_px(), True)]
+
     def __init__(self, sprites: Group, space: Space):
         super().__init__(sprites, space, Coord(0, 0), Size(1600, 50))
 
-        self.shape.collision_type = CollisionTypes.GROUND.value
+        self.set_collision_type(CollisionTypes.GROUND)
         self.body.body_type = Body.STATIC
 
-        img = pygame.image.load("resources/taskbar.png").convert_alpha()
-        img = pygame.transform.scale(img, (self.rect.width, self.rect.height))
-        self.image = img
+        self.image = Assets.instance().load(*self.assets()[0])
+
+        # The start menu slides out from behind the taskbar, so it has to stay a sprite
+        self.bakeable = False
 
 
 class Icon(Entity):
@@ -580,7 +1153,7 @@ class Icon(Entity):
     def __init__(self, sprites: Group, space: Space, pos: Coord, img: Surface):
         super().__init__(sprites, space, pos, Size(40, 40))
 
-        self.shape.collision_type = CollisionTypes.GROUND.value
+        self.set_collision_type(CollisionTypes.GROUND)
         self.body.body_type = Body.STATIC
 
         self.image = img
@@ -588,26 +1161,68 @@ class Icon(Entity):
 
 class WindowsMap(BaseMap):
 
-    def __init__(self, sprites: Group):
-        super().__init__(sprites)
+    @staticmethod
+    def background_asset() -> AssetKey:
+        return ("resources/background.png", Screen.instance().size, False)
+
+    @staticmethod
+    def icon_assets() -> list[AssetKey]:
+        return [(f"resources/icon{i:02d}.png", Size(40, 40).to_px(), True) for i in range(1, 12)]
+
+    # Every image the map loads, so they can be read before the map is built
+    @classmethod
+    def assets(cls) -> list[AssetKey]:
+        return [
+            cls.background_asset(),
+            *cls.icon_assets(),
+            *StartMenu.assets(),
+            *Calendar.assets(),
+            *Taskbar.assets(),
+            *CppCharacter.assets(),
+            *PythonCharacter.assets(),
+        ]
 
-        background = pygame.image.load("resources/background.png").convert_alpha()
-        background = pygame.transform.scale(background, Screen.instance().size)
-        self.background = background
+    # Keyboard players unless other inputs are given
+    def __init__(self,
+                 sprites: Group,
+                 seed: Optional[int] = None,
+                 inputs: Optional[tuple[BaseInput, BaseInput]] = None):
+        super().__init__(sprites, seed)
+
+        if inputs is None:
+            inputs = (P1Input(), P2Input())
+
+        assets = Assets.instance()
+
+        self.background = assets.load(*self.background_asset())
 
         StartMenu(self.sprites, self.space)
         Calendar(self.sprites, self.space)
         Taskbar(self.sprites, self.space)
 
-        icons = []
-        for i in range(1, 12):
-            icon = pygame.image.load(f"resources/icon{i:02d}.png").convert_alpha()
-            icons.append(pygame.transform.scale(icon, Size(40, 40).to_px()))
+        icons = [assets.load(*key) for key in self.icon_assets()]
 
         for i in range(3):
             for j in range(10):
-                icon = randrange(0, 11)
+                icon = self.space.random.randrange(0, 11)
                 Icon(self.sprites, self.space, Coord(j * 120 + 250, i * 230 + 120), icons[icon])
 
-        self.player1 = CppCharacter(self.sprites, self.space, Coord(0, 100), P1Input())
-        self.player2 = PythonCharacter(self.sprites, self.space, Coord(1550, 100), P2Input())
+        self.player1 = CppCharacter(self.sprites, self.space, Coord(0, 100), inputs[0])
+        self.player2 = PythonCharacter(self.sprites, self.space, Coord(1550, 100), inputs[1])
+
+        bullet_mode = GameConfig.instance().bullet_mode
+        if bullet_mode == "numpy":
+            from scenes.bullet_field import BulletField
+            self.bullet_field = BulletField(self.sprites, self.space)
+            self.player1.bullet_field = self.bullet_field
+            self.player2.bullet_field = self.bullet_field
+        else:
+            assert bullet_mode == "pymunk", "Invalid bullet mode"
+
+        weapon_mode = WeaponModes[GameConfig.instance().weapon_mode.upper()]
+        self.player1.weapon_mode = weapon_mode
+        self.player2.weapon_mode = weapon_mode
+
+        # Nothing is drawn without a display, the baked background isn't worth its memory there
+        if not GameConfig.instance().headless:
+            self.bake_static()
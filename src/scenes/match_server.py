@@ -0,0 +1,393 @@
+import asyncio
+import json
+import logging
+import struct
+from random import Random
+from time import perf_counter
+from typing import Optional
+
+from pygame.sprite import LayeredDirty
+from pymunk import Body
+
+from game_config import GameConfig
+from scenes.maps import BaseInput, Buttons, Calendar, Entity, StartMenu, WindowsMap
+from system.metrics import RollingSamples
+from scenes.replay import CONFIG_FIELDS
+from system.net import Address
+
+logger = logging.getLogger(__name__)
+
+"""
+Packets of a match server, integers are big-endian
+
+Lobby port
+    JOIN    kind                                        client to lobby, until ASSIGN arrives
+    ASSIGN  kind, match, player, port, json             lobby to client, port is the match's worker
+
+Worker port
+    INPUT   kind, match, player, seq, ack, buttons, jumps
+    STATE   kind, match, tick, base, hp1, hp2, winner, changed, removed, records..., removed ids...
+
+INPUT is sent every client frame with the held buttons, jumps counts the jump
+presses so a lost packet doesn't lose one. ack is the last STATE tick received.
+STATE holds what changed since the base tick the client acknowledged, or
+everything when base is NO_TICK. A record is id, kind, x, y in map coordinates.
+A full state with many bullets is larger than MAX_DATAGRAM, clients read STATE
+with a buffer of MAX_STATE bytes.
+"""
+
+JOIN = 1
+ASSIGN = 2
+INPUT = 3
+STATE = 4
+
+_ASSIGN = struct.Struct("!BIBH")
+_INPUT = struct.Struct("!BIBIIBB")
+_STATE = struct.Struct("!BIIIffBHH")
+_RECORD = struct.Struct("!HBhh")
+_REMOVED = struct.Struct("!H")
+
+NO_TICK = 0xFFFFFFFF
+# Largest UDP payload
+MAX_STATE = 65507
+
+_JUMP = int(Buttons.JUMP)
+_HELD = int(Buttons.LEFT | Buttons.RIGHT | Buttons.ATTACK)
+
+# Seconds an assignment is resent to a client whose JOIN comes again, its ASSIGN was lost
+ASSIGN_KEEP_SEC = 30
+
+# Kinds of records, static entities aren't sent as a client builds them from the seed
+PLAYER1 = 1
+PLAYER2 = 2
+START_MENU = 3
+CALENDAR = 4
+BULLET1 = 5
+BULLET2 = 6
+
+# Ids of NumPy field bullets are their row plus this
+FIELD_ID = 0x8000
+
+# Ticks of states kept to send deltas against
+STATE_HISTORY_TICKS = 64
+# Seconds the final state keeps being sent once there is a winner
+END_LINGER_SEC = 3
+# Seconds without an input from either player before a match is dropped
+CLIENT_TIMEOUT_SEC = 10
+# Ticks a late match may run back to back to catch up, it falls behind beyond that
+MAX_CATCH_UP_TICKS = 5
+# Seconds of step times a match keeps for its percentiles
+METRICS_SEC = 10
+
+
+class ServerInput(BaseInput):
+
+    # Buttons of a remote client, a jump is a press the next step consumes
+    def __init__(self):
+        self.held = 0
+        self._jumps = 0
+        self._jump = False
+
+    # Without asking for each button, the server runs many of these every tick
+    def buttons(self) -> int:
+        return self.held & _HELD | (_JUMP if self.jump() else 0)
+
+    def receive(self, buttons: int, jumps: int):
+        self.held = buttons
+        if jumps != self._jumps:
+            self._jumps = jumps
+            self._jump = True
+
+    def jump(self) -> bool:
+        jump = self._jump
+        self._jump = False
+        return jump
+
+    def left(self) -> bool:
+        return bool(self.held & Buttons.LEFT)
+
+    def right(self) -> bool:
+        return bool(self.held & Buttons.RIGHT)
+
+    def basic_attack(self) -> bool:
+        return bool(self.held & Buttons.ATTACK)
+
+
+# What a player needs to build the match's map and find its worker
+def assign_packet(match: int, player: int, port: int, seed: int) -> bytes:
+    config = GameConfig.instance()
+    header = {"seed": seed, **{field: getattr(config, field) for field in CONFIG_FIELDS}}
+    return _ASSIGN.pack(ASSIGN, match, player, port) + json.dumps(header).encode()
+
+
+def input_packet(match: int, player: int, seq: int, ack: int, buttons: int, jumps: int) -> bytes:
+    return _INPUT.pack(INPUT, match, player, seq, ack, buttons, jumps)
+
+
+class Lobby:
+
+    # Pairs the clients that JOIN in the order they came, handing each pair to a worker
+    def __init__(self, ports: list[int]):
+        self.ports = ports
+        # Matches each worker was given, a new match goes to the one with the fewest
+        self.loads = [0] * len(ports)
+        self._waiting: Optional[Address] = None
+        self._next_match = 1
+        self._random = Random()
+        # Address to (ASSIGN packet, time it was made)
+        self._assigned: dict[Address, tuple[bytes, float]] = {}
+
+    # Packets to send back, and the (worker, match, seed) started if a pair was made
+    def receive(self, data: bytes, address: Address) \
+            -> tuple[list[tuple[Address, bytes]], Optional[tuple[int, int, int]]]:
+        if not data or data[0] != JOIN:
+            return [], None
+
+        now = perf_counter()
+        assigned = self._assigned.get(address)
+        if assigned is not None and now - assigned[1] < ASSIGN_KEEP_SEC:
+            return [(address, assigned[0])], None
+
+        if self._waiting is None or self._waiting == address:
+            self._waiting = address
+            return [], None
+
+        worker = self.loads.index(min(self.loads))
+        self.loads[worker] += 1
+        match = self._next_match
+        self._next_match += 1
+        seed = self._random.getrandbits(32)
+
+        packets = []
+        for player, client in enumerate((self._waiting, address)):
+            packet = assign_packet(match, player, self.ports[worker], seed)
+            self._assigned[client] = (packet, now)
+            packets.append((client, packet))
+        self._waiting = None
+
+        self._assigned = {client: assigned for client, assigned in self._assigned.items()
+                          if now - assigned[1] < ASSIGN_KEEP_SEC}
+        return packets, (worker, match, seed)
+
+    def ended(self, worker: int):
+        self.loads[worker] -= 1
+
+
+class StateEncoder:
+
+    # Quantized states of the last ticks, each one a dict of id to (kind, x, y)
+    def __init__(self, game_map: WindowsMap):
+        self.map = game_map
+        self._records: dict[Entity, Optional[tuple[int, int]]] = {}
+        self._states: dict[int, dict[int, tuple[int, int, int]]] = {}
+
+    # Id and kind of an entity, None for a static one
+    def _record(self, entity: Entity) -> Optional[tuple[int, int]]:
+        if entity.body.body_type == Body.STATIC:
+            record = None
+        elif entity is self.map.player1:
+            record = (len(self._records) + 1, PLAYER1)
+        elif entity is self.map.player2:
+            record = (len(self._records) + 1, PLAYER2)
+        elif isinstance(entity, StartMenu):
+            record = (len(self._records) + 1, START_MENU)
+        elif isinstance(entity, Calendar):
+            record = (len(self._records) + 1, CALENDAR)
+        else:
+            record = (len(self._records) + 1, BULLET1 if entity.owner is self.map.player1 else BULLET2)
+        self._records[entity] = record
+        return record
+
+    # Take the state of the tick the map is at
+    def capture(self) -> int:
+        records = self._records
+        state = {}
+        for entity in self.map.space.registry:
+            # Entities keep their body type and owner, so both are looked up once
+            record = records[entity] if entity in records else self._record(entity)
+            if record is not None:
+                x, y = entity.body.position
+                state[record[0]] = (record[1], round(x), round(y))
+
+        field = self.map.bullet_field
+        if field is not None:
+            positions, _, owners, characters = field.live()
+            kinds = [BULLET1 if character is self.map.player1 else BULLET2 for character in characters]
+            for row, ((x, y), owner) in enumerate(zip(positions.round().astype(int).tolist(), owners.tolist())):
+                state[FIELD_ID + row] = (kinds[owner], x, y)
+
+        tick = self.map.space.time.ticks
+        self._states[tick] = state
+        self._states.pop(tick - STATE_HISTORY_TICKS, None)
+        return tick
+
+    # The last captured state, against the base tick when it is still known
+    def encode(self, match: int, tick: int, base: int, hp: tuple[float, float], winner: int) -> bytes:
+        state = self._states[tick]
+        base_state = self._states.get(base)
+        if base_state is None or base >= tick:
+            base = NO_TICK
+            base_state = {}
+
+        changed = [(entity_id, record) for entity_id, record in state.items() if base_state.get(entity_id) != record]
+        removed = [entity_id for entity_id in base_state if entity_id not in state]
+
+        parts = [_STATE.pack(STATE, match, tick, base, *hp, winner, len(changed), len(removed))]
+        parts.extend(_RECORD.pack(entity_id, *record) for entity_id, record in changed)
+        parts.extend(_REMOVED.pack(entity_id) for entity_id in removed)
+        return b"".join(parts)
+
+
+class Match:
+
+    def __init__(self, match_id: int, seed: int):
+        self.id = match_id
+        self.inputs = (ServerInput(), ServerInput())
+        self.map = WindowsMap(LayeredDirty(), seed, self.inputs)
+        self.encoder = StateEncoder(self.map)
+
+        # Addresses are learned from the first input of each player
+        self.clients: list[Optional[Address]] = [None, None]
+        self._seq = [0, 0]
+        self._acked = [NO_TICK, NO_TICK]
+        self._last_input = perf_counter()
+
+        # 1 or 2 once a player has won
+        self.winner = 0
+        self._ended_at: Optional[float] = None
+
+        tick_rate = GameConfig.instance().tick_rate
+        # Seconds each step took, and how late each one started
+        self.step_times = RollingSamples(METRICS_SEC * tick_rate)
+        self.late_times = RollingSamples(METRICS_SEC * tick_rate)
+
+    @property
+    def is_ready(self) -> bool:
+        return None not in self.clients
+
+    @property
+    def is_over(self) -> bool:
+        now = perf_counter()
+        if self._ended_at is not None:
+            return now - self._ended_at > END_LINGER_SEC
+        return now - self._last_input > CLIENT_TIMEOUT_SEC
+
+    def receive_input(self, address: Address, player: int, seq: int, ack: int, buttons: int, jumps: int):
+        if self.clients[player] is None:
+            self.clients[player] = address
+        elif self.clients[player] != address:
+            return
+
+        # Older than one already applied, it came out of order
+        if seq <= self._seq[player]:
+            return
+        self._seq[player] = seq
+        self._acked[player] = ack
+        self._last_input = perf_counter()
+
+        self.inputs[player].receive(buttons, jumps)
+
+    def step(self):
+        if self.winner:
+            return
+
+        self.map.update()
+        self.map.fixed_update()
+
+        if self.map.player1.hp <= 0:
+            self.winner = 2
+        elif self.map.player2.hp <= 0:
+            self.winner = 1
+
+        if self.winner:
+            self._ended_at = perf_counter()
+            logger.info("Match %d won by player %d at tick %d", self.id, self.winner, self.map.space.time.ticks)
+
+    # STATE packets for the players, both usually acknowledged the same tick
+    def states(self) -> list[tuple[Address, bytes]]:
+        tick = self.encoder.capture()
+        hp = (self.map.player1.hp, self.map.player2.hp)
+
+        packets = []
+        encoded: dict[int, bytes] = {}
+        for client, base in zip(self.clients, self._acked):
+            if base not in encoded:
+                encoded[base] = self.encoder.encode(self.id, tick, base, hp, self.winner)
+            packets.append((client, encoded[base]))
+        return packets
+
+    def metrics(self) -> dict:
+        return {
+            "match": self.id,
+            "ticks": self.map.space.time.ticks,
+            "step_p50_ms": self.step_times.percentile(50) * 1000,
+            "step_p99_ms": self.step_times.percentile(99) * 1000,
+            "step_max_ms": self.step_times.max() * 1000,
+            "late_p99_ms": self.late_times.percentile(99) * 1000,
+        }
+
+
+class MatchWorker(asyncio.DatagramProtocol):
+
+    # Runs matches on one event loop, every match steps on its own fixed tick
+    def __init__(self):
+        self.matches: dict[int, Match] = {}
+        self.transport: Optional[asyncio.DatagramTransport] = None
+
+        # Seconds spent stepping and sending, and ticks stepped, since the last report.
+        # Kept here so matches that ended since still count
+        self.busy = 0.0
+        self.ticks = 0
+
+    def connection_made(self, transport: asyncio.DatagramTransport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, address: Address):
+        if len(data) != _INPUT.size or data[0] != INPUT:
+            return
+
+        _, match_id, player, seq, ack, buttons, jumps = _INPUT.unpack(data)
+        match = self.matches.get(match_id)
+        if match is not None and player < 2:
+            match.receive_input(address, player, seq, ack, buttons, jumps)
+
+    def start(self, match_id: int, seed: int) -> asyncio.Task:
+        match = Match(match_id, seed)
+        self.matches[match_id] = match
+        return asyncio.create_task(self._run(match))
+
+    async def _run(self, match: Match):
+        loop = asyncio.get_running_loop()
+        dt = 1 / GameConfig.instance().tick_rate
+        next_tick = loop.time()
+
+        while not match.is_over:
+            now = loop.time()
+            if now < next_tick:
+                await asyncio.sleep(next_tick - now)
+                continue
+
+            late = now - next_tick
+            if late > MAX_CATCH_UP_TICKS * dt:
+                # Too far behind, let the match slow down instead of stepping in bursts
+                next_tick = now
+            next_tick += dt
+
+            # Nobody to play or watch until both players are there
+            if not match.is_ready:
+                continue
+
+            start = perf_counter()
+            match.step()
+            for client, packet in match.states():
+                self.transport.sendto(packet, client)
+            elapsed = perf_counter() - start
+
+            match.step_times.add(elapsed)
+            match.late_times.add(late)
+            self.busy += elapsed
+            self.ticks += 1
+
+        del self.matches[match.id]
+        return match.metrics()
+
@@ -0,0 +1,454 @@
+import json
+import logging
+import struct
+import zlib
+from random import getrandbits
+from time import perf_counter, sleep
+from typing import NamedTuple, Optional
+
+import pygame
+
+from game_config import GameConfig
+from scenes.maps import BaseInput, BaseMap, Buttons, Character, MapSnapshot
+from scenes.replay import CONFIG_FIELDS, ReplayRecorder
+from system.net import LinkSimulator, Peer, parse_address
+
+logger = logging.getLogger(__name__)
+
+"""
+Packets, integers are unsigned and big-endian
+
+    HELLO   kind, version       client to host, until START arrives
+    START   kind, match, json   host to client, the answer to every HELLO
+    INPUTS  kind, match, tick, ack, checksum tick, checksum, first tick, count, buttons...
+    QUIT    kind, match
+
+INPUTS carries the sender's buttons from the first tick the other side hasn't
+acknowledged, so a lost packet is covered by the next one. ack is the number of
+the other side's ticks the sender has received.
+"""
+
+PROTOCOL_VERSION = 1
+
+HELLO = 1
+START = 2
+INPUTS = 3
+QUIT = 4
+
+_HELLO = struct.Struct("!BB")
+# START and QUIT
+_MATCH = struct.Struct("!BI")
+_INPUTS = struct.Struct("!BIIIIIIB")
+
+# Sent as the checksum tick before the first checksum
+NO_TICK = 0xFFFFFFFF
+# Most buttons one INPUTS packet carries
+MAX_PACKET_TICKS = 255
+
+# Rollbacks re-simulate from the keyframe before the mispredicted tick, so sessions keep them close
+NET_KEYFRAME_TICKS = 4
+
+# Seconds between HELLOs while joining
+HELLO_INTERVAL_SEC = 0.1
+# Seconds to wait for the other player before giving up
+CONNECT_TIMEOUT_SEC = 60
+# Seconds without a packet before the other player counts as gone
+DISCONNECT_TIMEOUT_SEC = 5
+# Ticks between the state checksums the players compare to find desyncs
+CHECKSUM_TICKS = 60
+# Ticks one side may run ahead of the other before it waits for it
+MAX_ADVANTAGE_TICKS = 2
+
+
+class Connection(NamedTuple):
+    peer: Peer
+    match: int
+    # 0 plays player 1, 1 plays player 2
+    player: int
+    seed: int
+    # What the host answers a repeated HELLO with, empty on the client
+    start_packet: bytes
+
+
+# Host or join the match the config asks for, blocks until the other player is there
+def connect() -> Connection:
+    config = GameConfig.instance()
+    link = LinkSimulator(config.net_latency_ms, config.net_jitter_ms, config.net_loss)
+
+    if config.net_role == "host":
+        return host_match(config.net_address, link)
+    assert config.net_role == "client", "Invalid net role"
+    return join_match(config.net_address, link)
+
+
+def host_match(address: str, link: LinkSimulator) -> Connection:
+    config = GameConfig.instance()
+    seed = config.seed if config.seed is not None else getrandbits(32)
+    match = getrandbits(32)
+
+    header = {"seed": seed}
+    for field in CONFIG_FIELDS:
+        header[field] = getattr(config, field)
+    start_packet = _MATCH.pack(START, match) + json.dumps(header).encode()
+
+    peer = Peer(parse_address(address, ""), link=link)
+    logger.info("Waiting for a player on %s", address)
+
+    deadline = perf_counter() + CONNECT_TIMEOUT_SEC
+    while perf_counter() < deadline:
+        for data, sender in peer.receive():
+            if len(data) != _HELLO.size or data[0] != HELLO:
+                continue
+            if _HELLO.unpack(data)[1] != PROTOCOL_VERSION:
+                logger.warning("%s:%d plays another version of the game", *sender)
+                continue
+
+            peer.remote = sender
+            peer.send(start_packet)
+            logger.info("%s:%d joined", *sender)
+            return Connection(peer, match, 0, seed, start_packet)
+
+        _wait()
+
+    peer.close()
+    raise TimeoutError(f"Nobody joined {address}")
+
+
+def join_match(address: str, link: LinkSimulator) -> Connection:
+    peer = Peer(("", 0), parse_address(address, "localhost"), link)
+    hello = _HELLO.pack(HELLO, PROTOCOL_VERSION)
+    logger.info("Joining %s", address)
+
+    deadline = perf_counter() + CONNECT_TIMEOUT_SEC
+    while perf_counter() < deadline:
+        peer.send(hello)
+        _wait()
+
+        for data, sender in peer.receive():
+            if sender != peer.remote or len(data) < _MATCH.size or data[0] != START:
+                continue
+
+            match = _MATCH.unpack_from(data)[1]
+            header = json.loads(data[_MATCH.size:])
+
+            config = GameConfig.instance()
+            different = [field for field in CONFIG_FIELDS if header[field] != getattr(config, field)]
+            if different:
+                peer.close()
+                raise ValueError(f"The host plays with other settings: {', '.join(different)}")
+
+            return Connection(peer, match, 1, header["seed"], b"")
+
+    peer.close()
+    raise TimeoutError(f"Nobody is hosting on {address}")
+
+
+# Keep the window responding while the players find each other
+def _wait():
+    pygame.event.pump()
+    sleep(HELLO_INTERVAL_SEC)
+
+
+class InputHistory:
+
+    # Buttons of both players by tick, the remote player's are predicted until they arrive
+    def __init__(self, local_player: int):
+        self.local_player = local_player
+        self.local: list[int] = []
+        self.remote: list[int] = []
+        # Remote buttons each tick was last simulated with, received or predicted
+        self.used: list[int] = []
+
+    # Ticks both players' buttons are known for
+    @property
+    def confirmed(self) -> int:
+        return min(len(self.local), len(self.remote))
+
+    def buttons(self, tick: int, player: int) -> int:
+        if player == self.local_player:
+            return self.local[tick]
+
+        if tick < len(self.remote):
+            buttons = self.remote[tick]
+        elif self.remote:
+            # Held buttons are likely still held, a jump is a single press
+            buttons = int(self.remote[-1] & ~Buttons.JUMP)
+        else:
+            buttons = 0
+
+        if tick < len(self.used):
+            self.used[tick] = buttons
+        else:
+            self.used.append(buttons)
+        return buttons
+
+    # Buttons of both players in player order, for a confirmed tick
+    def both(self, tick: int) -> tuple[int, int]:
+        if self.local_player == 0:
+            return (self.local[tick], self.remote[tick])
+        return (self.remote[tick], self.local[tick])
+
+    # Add remote buttons from the first tick on, returns the first simulated tick that was mispredicted
+    def confirm(self, first: int, buttons: bytes) -> Optional[int]:
+        if first > len(self.remote):
+            # An earlier packet went missing, a later one will carry these again
+            return None
+
+        mispredicted = None
+        for value in buttons[len(self.remote) - first:]:
+            tick = len(self.remote)
+            self.remote.append(value)
+            if mispredicted is None and tick < len(self.used) and self.used[tick] != value:
+                mispredicted = tick
+        return mispredicted
+
+
+class NetworkInput(BaseInput):
+
+    def __init__(self, history: InputHistory, player: int):
+        self.history = history
+        self.player = player
+        self._character: Optional[Character] = None
+
+    def bind(self, character: Character):
+        self._character = character
+
+    # Read by the map's step count, so a re-simulated step gets the buttons known by then
+    def buttons(self) -> int:
+        return self.history.buttons(self._character.space.time.ticks, self.player)
+
+    def jump(self) -> bool:
+        return bool(self.buttons() & Buttons.JUMP)
+
+    def left(self) -> bool:
+        return bool(self.buttons() & Buttons.LEFT)
+
+    def right(self) -> bool:
+        return bool(self.buttons() & Buttons.RIGHT)
+
+    def basic_attack(self) -> bool:
+        return bool(self.buttons() & Buttons.ATTACK)
+
+
+def network_inputs(history: InputHistory) -> tuple[NetworkInput, NetworkInput]:
+    return (NetworkInput(history, 0), NetworkInput(history, 1))
+
+
+# Checksum of the numbers in a snapshot, the entities themselves are kept by reference and skipped
+def checksum(snapshot: MapSnapshot) -> int:
+    values = [snapshot.ticks]
+    _numbers(snapshot.entities, values)
+    if snapshot.bullet_field is not None:
+        values.extend(zlib.crc32(column.tobytes()) for column in snapshot.bullet_field)
+    return zlib.crc32(repr(values).encode())
+
+
+def _numbers(state: tuple, values: list):
+    for value in state:
+        if isinstance(value, (int, float)):
+            values.append(value)
+        elif isinstance(value, tuple):
+            _numbers(value, values)
+
+
+class RollbackSession:
+
+    # Steps the map with the local player's buttons at once and predicts the remote player's,
+    # a late remote input rolls the map back and re-simulates it
+    def __init__(self, game_map: BaseMap, connection: Connection, history: InputHistory, local_input: BaseInput):
+        self.map = game_map
+        self.connection = connection
+        self.peer = connection.peer
+        self.history = history
+        self.local_input = local_input
+
+        # Set to write the confirmed inputs to a replay, re-simulated steps are not recorded twice
+        self.recorder: Optional[ReplayRecorder] = None
+        self._recorded = 0
+
+        # Keyframe snapshots from the last one every tick after it is confirmed for
+        self._snapshots: dict[int, MapSnapshot] = {}
+        self._mispredicted: Optional[int] = None
+
+        # What the other side last told: its tick, and how many of the local ticks it has
+        self._remote_ticks = 0
+        self.acked = 0
+
+        # Checksums of confirmed ticks, kept until the other side's arrives
+        self._checksums: dict[int, int] = {}
+        self._remote_checksums: dict[int, int] = {}
+        self._last_checksum = (NO_TICK, 0)
+        self._checked = -1
+
+        self._last_received = perf_counter()
+        self.disconnected = False
+
+        # Logged once the session ends
+        self.rollbacks = 0
+        self.rollback_ticks = 0
+        self.stalls = 0
+        self.desyncs = 0
+
+    @property
+    def ticks(self) -> int:
+        return self.map.space.time.ticks
+
+    # True when nothing the map shows can still be rolled back
+    @property
+    def is_confirmed(self) -> bool:
+        return self._mispredicted is None and self.history.confirmed >= self.ticks
+
+    # Called once per rendered frame
+    def update(self):
+        self.local_input.poll()
+
+    # Called once per physics step, the step is skipped while waiting for the other side
+    def fixed_update(self):
+        self.poll()
+
+        if self._is_waiting():
+            self.stalls += 1
+        else:
+            self.history.local.append(self.local_input.buttons())
+            self._step()
+
+        self.send()
+
+    # Read the packets that arrived and roll back to the first mispredicted tick
+    def poll(self):
+        now = perf_counter()
+
+        for data, sender in self.peer.receive():
+            if sender != self.peer.remote or not data:
+                continue
+            self._last_received = now
+
+            kind = data[0]
+            if kind == HELLO and self.connection.start_packet:
+                # START was lost on the way
+                self.peer.send(self.connection.start_packet)
+            elif kind == INPUTS and len(data) >= _INPUTS.size:
+                self._receive_inputs(data)
+            elif kind == QUIT and _MATCH.unpack_from(data)[1] == self.connection.match:
+                logger.info("The other player left")
+                self.disconnected = True
+
+        if now - self._last_received > DISCONNECT_TIMEOUT_SEC and not self.disconnected:
+            logger.warning("Lost the other player")
+            self.disconnected = True
+
+        if self._mispredicted is not None:
+            self._rollback(self._mispredicted)
+            self._mispredicted = None
+
+        self._confirm_snapshots()
+        self._record()
+
+    def _receive_inputs(self, data: bytes):
+        _, match, ticks, ack, checksum_tick, remote_checksum, first, count = _INPUTS.unpack_from(data)
+        if match != self.connection.match:
+            return
+
+        self._remote_ticks = max(self._remote_ticks, ticks)
+        self.acked = max(self.acked, ack)
+
+        if checksum_tick != NO_TICK:
+            self._remote_checksums[checksum_tick] = remote_checksum
+            self._compare_checksums(checksum_tick)
+
+        mispredicted = self.history.confirm(first, data[_INPUTS.size:_INPUTS.size + count])
+        if mispredicted is not None and (self._mispredicted is None or mispredicted < self._mispredicted):
+            self._mispredicted = mispredicted
+
+    def _is_waiting(self) -> bool:
+        if self.disconnected:
+            return True
+
+        # Let the inputs before the finishing blow arrive, they may still save the player
+        if self.map.player1.hp <= 0 or self.map.player2.hp <= 0:
+            return True
+
+        if self.ticks - self.history.confirmed >= GameConfig.instance().net_rollback_ticks:
+            return True
+
+        # Both sides see the other behind by the latency, half the difference is how far this one is ahead
+        local_lag = self.ticks - len(self.history.remote)
+        remote_lag = self._remote_ticks - self.acked
+        return (local_lag - remote_lag) / 2 > MAX_ADVANTAGE_TICKS
+
+    def _step(self):
+        ticks = self.ticks
+        if ticks % NET_KEYFRAME_TICKS == 0:
+            self._snapshots[ticks] = self.map.snapshot()
+
+        self.map.fixed_update()
+
+    # Restoring a snapshot is exact, so re-simulating from one plays the ticks as they would have
+    def _rollback(self, tick: int):
+        start = max(t for t in self._snapshots if t <= tick)
+        end = self.ticks
+
+        self.map.restore(self._snapshots[start])
+        while self.ticks < end:
+            self._step()
+
+        self.rollbacks += 1
+        self.rollback_ticks += end - start
+
+    # Checksum the snapshots nothing can roll back anymore, and drop the ones no rollback can reach
+    def _confirm_snapshots(self):
+        confirmed = self.history.confirmed
+        final = [tick for tick in self._snapshots if tick <= confirmed]
+
+        for tick in final:
+            if tick % CHECKSUM_TICKS == 0 and tick > self._checked:
+                self._checked = tick
+                self._checksums[tick] = checksum(self._snapshots[tick])
+                self._last_checksum = (tick, self._checksums[tick])
+                self._compare_checksums(tick)
+
+        for tick in final:
+            if tick != max(final):
+                del self._snapshots[tick]
+
+    def _compare_checksums(self, tick: int):
+        if tick not in self._checksums or tick not in self._remote_checksums:
+            return
+
+        if self._checksums[tick] != self._remote_checksums[tick]:
+            logger.error("The players' matches differ at tick %d", tick)
+            self.desyncs += 1
+
+        for checksums in (self._checksums, self._remote_checksums):
+            for old in [t for t in checksums if t <= tick]:
+                del checksums[old]
+
+    def _record(self):
+        if self.recorder is None:
+            return
+
+        while self._recorded < self.history.confirmed:
+            self.recorder.record(*self.history.both(self._recorded))
+            self._recorded += 1
+
+    # The local buttons the other side hasn't acknowledged, with the latest checksum
+    def send(self):
+        first = self.acked
+        buttons = bytes(self.history.local[first:first + MAX_PACKET_TICKS])
+        packet = _INPUTS.pack(
+            INPUTS, self.connection.match, self.ticks, len(self.history.remote),
+            *self._last_checksum, first, len(buttons))
+        self.peer.send(packet + buttons)
+
+    def release(self):
+        # The last inputs once more, the other side may still be missing them
+        self.send()
+        self.peer.send(_MATCH.pack(QUIT, self.connection.match))
+        self.peer.close()
+
+        if self.recorder is not None:
+            self.recorder.close()
+
+        logger.info(
+            "Network match ended at tick %d: %d rollbacks re-simulated %d ticks, waited %d ticks, %d desyncs",
+            self.ticks, self.rollbacks, self.rollback_ticks, self.stalls, self.desyncs)
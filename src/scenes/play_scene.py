@@ -1,8 +1,17 @@
-from pygame import Surface, draw
-from pygame.sprite import DirtySprite
+from typing import Optional
 
-from scenes.common import FPS, RatioRect, render_text
-from scenes.maps import WindowsMap, Character
+import pygame
+from pygame import Surface, draw
+from pygame.sprite import DirtySprite, Group, LayeredDirty
+
+from game_config import GameConfig
+from scenes.common import FPS, ProfilerOverlay, RatioRect, render_text
+from scenes.maps import WindowsMap, Character, P1Input
+from scenes.netplay import InputHistory, RollbackSession, connect, network_inputs
+from scenes.replay import Keyframes, Replay, ReplayRecorder, replay_inputs
+from system.assets import AssetKey
+from system.event_handler import EventHandler
+from system.profiler import Profiler
 from system.scenes import Scenes, BaseScene
 from system.screen import Screen
 
@@ -15,8 +24,11 @@ class HPBar(DirtySprite):
         self.rect = rect.to_pyrect()
         self.dir = dir
         self.player = player
+
+        # Only redraw when the hp changes
+        self._rendered_hp = self.player.hp
         self.image = self._create_surface()
-        self.dirty = 2
+        self.dirty = 1
 
     def _create_surface(self) -> Surface:
         surface = Surface(self.rect.size)
@@ -49,15 +61,78 @@ class HPBar(DirtySprite):
         return surface
 
     def update(self):
+        if self.player.hp == self._rendered_hp:
+            return
+
+        self._rendered_hp = self.player.hp
         self.image = self._create_surface()
+        self.dirty = 1
+
+
+# The map of a match on this computer, against the keyboard or bots
+def local_map(sprites: Group) -> WindowsMap:
+    config = GameConfig.instance()
+    if any(config.bots):
+        from scenes.bots import bot_inputs
+        return WindowsMap(sprites, config.seed, bot_inputs(config.bots, config.seed or 0))
+    return WindowsMap(sprites, config.seed)
+
+
+# Build the next local match's map ahead, while a menu waits for the player. None when its
+# timers run on the wall clock, they would run out before the match starts
+def prebuild_map() -> Optional[WindowsMap]:
+    if GameConfig.instance().timer_source != "simulation":
+        return None
+    return local_map(LayeredDirty())
+
+
+# Seconds the arrow keys move a watched replay by
+REPLAY_SEEK_SEC = 5
+# Key toggling the profiler and its overlay
+PROFILER_KEY = pygame.K_F3
 
 
 class PlayScene(BaseScene):
 
-    def __init__(self):
+    @classmethod
+    def assets(cls) -> list[AssetKey]:
+        return WindowsMap.assets()
+
+    # game_map is a map from prebuild_map, its sprites become the scene's
+    def __init__(self, game_map: Optional[WindowsMap] = None):
         super().__init__()
 
-        self.map = WindowsMap(self.sprites)
+        config = GameConfig.instance()
+
+        # Only set while playing a replay
+        self.keyframes: Optional[Keyframes] = None
+        # Only set while playing against another computer
+        self.session: Optional[RollbackSession] = None
+
+        if game_map is not None:
+            self.map = game_map
+            self.sprites = game_map.sprites
+        elif config.replay_path:
+            replay = Replay.load(config.replay_path)
+            self.map = WindowsMap(self.sprites, replay.seed, replay_inputs(replay))
+            self.keyframes = Keyframes(self.map, replay)
+            self.keyframes.seek(config.replay_seek)
+        elif config.net_role:
+            connection = connect()
+            history = InputHistory(connection.player)
+            self.map = WindowsMap(self.sprites, connection.seed, network_inputs(history))
+            # Either side plays with the first player's keys
+            self.session = RollbackSession(self.map, connection, history, P1Input())
+        else:
+            self.map = local_map(self.sprites)
+
+        if config.record_dir and not config.replay_path:
+            recorder = ReplayRecorder.create(config.record_dir, self.map.seed)
+            if self.session is not None:
+                self.session.recorder = recorder
+            else:
+                self.map.recorder = recorder
+
         self.background = self.map.background
 
         hp1rect = RatioRect(0, 0, 0.4, 0.05)
@@ -71,29 +146,77 @@ class PlayScene(BaseScene):
         self.sprites.add(HPBar(hp2rect, self.map.player2, "right"))
 
         # self.sprites.add(FPS(RatioRect(0, 0, 0.04, 0.03)))
+        self.sprites.add(ProfilerOverlay(RatioRect(0, 0.06, 0.3, 0.5)))
+
+        self.winner = ""
 
     def update(self):
         super().update()
 
+        if EventHandler.instance().is_key_down[PROFILER_KEY]:
+            Profiler.instance().toggle()
+
+        # A network match only ends once the other player's inputs can't undo it
+        is_final = self.session is None or self.session.is_confirmed
+
         if (self.map.player1.hp <= 0
-            or self.map.player2.hp <= 0):
+            or self.map.player2.hp <= 0) and is_final:
             scenes = Scenes.instance()
 
-            winner = ""
             if self.map.player1.hp <= 0:
-                winner = "Player 2"
+                self.winner = "Player 2"
             elif self.map.player2.hp <= 0:
-                winner = "Player 1"
+                self.winner = "Player 1"
             else:
                 assert False
 
             from scenes.game_over_scene import GameOverScene
-            scenes.change_scene(GameOverScene(winner))
+            scenes.change_scene(GameOverScene(self.winner))
+
+        if self.keyframes is not None:
+            self._seek_replay()
+
+        if self.session is not None:
+            self.session.update()
+            if self.session.disconnected and not Scenes.instance().is_changed:
+                from scenes.title_scene import TitleScene
+                Scenes.instance().change_scene(TitleScene())
 
         self.map.update()
-        self.sprites.update()
+
+    def _seek_replay(self):
+        event_handler = EventHandler.instance()
+        ticks = REPLAY_SEEK_SEC * GameConfig.instance().tick_rate
+
+        if event_handler.is_key_down[pygame.K_LEFT]:
+            self.keyframes.seek(self.keyframes.ticks - ticks)
+        elif event_handler.is_key_down[pygame.K_RIGHT]:
+            self.keyframes.seek(self.keyframes.ticks + ticks)
+
+    def fixed_update(self):
+        if self.keyframes is not None:
+            self.keyframes.fixed_update()
+        elif self.session is not None:
+            self.session.fixed_update()
+        else:
+            self.map.fixed_update()
 
     def render(self):
+        profiler = Profiler.instance()
+        if profiler.is_enabled:
+            profiler.count("bullets", self.map.live_bullets())
+
+        # Sprites are synced after the physics steps, so they interpolate the latest states
+        start = profiler.start()
+        self.map.sync_sprites()
+        self.sprites.update()
+        profiler.stop("sprites", start)
 
         screen = Screen.instance()
         screen.render(self.background, self.sprites)
+
+    def release(self):
+        if self.map.recorder is not None:
+            self.map.recorder.close()
+        if self.session is not None:
+            self.session.release()
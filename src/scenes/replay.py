@@ -0,0 +1,179 @@
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from game_config import GameConfig
+from scenes.maps import BaseInput, BaseMap, Buttons, Character, MapSnapshot
+
+logger = logging.getLogger(__name__)
+
+"""
+Replay file
+
+    WOLREPLAY 6\\n
+    {"seed": ..., "tick_rate": ..., ...}\\n
+    one byte per physics step: player 1 buttons | player 2 buttons << 4
+
+Steps are only ever appended, so a file cut short by a crash is still a valid
+replay of the steps before it.
+"""
+
+# Bumped whenever the simulation changes in a way that plays old recordings differently
+MAGIC = b"WOLREPLAY 6\n"
+
+# Ticks between the snapshots a replay is seeked back from
+REPLAY_KEYFRAME_TICKS = 60
+
+# Keyframes kept past this many ticks behind the replay are thinned to one in KEYFRAME_THINNING,
+# so a long replay holds a snapshot every few seconds only around where it is
+KEYFRAME_HORIZON_TICKS = 600
+KEYFRAME_THINNING = 10
+
+# Config fields a match depends on, a replay is played with the values it was recorded with
+CONFIG_FIELDS = ("tick_rate", "bullet_mode", "weapon_mode")
+
+# Steps written between flushes, at most this many are lost by a crash
+FLUSH_TICKS = 60
+
+
+class ReplayRecorder:
+
+    def __init__(self, path: Path, seed: int):
+        config = GameConfig.instance()
+        assert config.timer_source == "simulation", "Replays need the simulation timer source"
+
+        header = {"seed": seed}
+        for field in CONFIG_FIELDS:
+            header[field] = getattr(config, field)
+
+        self.path = path
+        self.ticks = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "wb")
+        self._file.write(MAGIC)
+        self._file.write(json.dumps(header).encode() + b"\n")
+        self._file.flush()
+
+    # A new file in the directory, named after the time the match started
+    @classmethod
+    def create(cls, directory: str, seed: int) -> "ReplayRecorder":
+        name = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        return cls(Path(directory) / f"{name}.wolr", seed)
+
+    def record(self, buttons1: int, buttons2: int):
+        self._file.write(bytes((buttons1 | buttons2 << 4,)))
+        self.ticks += 1
+
+        if self.ticks % FLUSH_TICKS == 0:
+            self._file.flush()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.close()
+        logger.info("Recorded %d ticks to %s", self.ticks, self.path)
+
+
+class Replay:
+
+    def __init__(self, header: dict, steps: bytes):
+        self.header = header
+        self.steps = steps
+
+    @classmethod
+    def load(cls, path: str) -> "Replay":
+        with open(path, "rb") as f:
+            if f.readline() != MAGIC:
+                raise ValueError(f"{path} is not a replay")
+            header = json.loads(f.readline())
+            steps = f.read()
+        return cls(header, steps)
+
+    @property
+    def seed(self) -> int:
+        return self.header["seed"]
+
+    # GameConfig fields the match was recorded with
+    def config(self) -> dict:
+        return {field: self.header[field] for field in CONFIG_FIELDS}
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    # Buttons of player 0 or 1, nothing is held after the end of the recording
+    def buttons(self, tick: int, player: int) -> int:
+        if tick >= len(self.steps):
+            return 0
+        return self.steps[tick] >> (player * 4) & 0xF
+
+
+class ReplayInput(BaseInput):
+
+    def __init__(self, replay: Replay, player: int):
+        self.replay = replay
+        self.player = player
+        self._character: Optional[Character] = None
+
+    def bind(self, character: Character):
+        self._character = character
+
+    # Read by the map's step count, so it stays in sync however the map got to that step
+    def buttons(self) -> int:
+        return self.replay.buttons(self._character.space.time.ticks, self.player)
+
+    def jump(self) -> bool:
+        return bool(self.buttons() & Buttons.JUMP)
+
+    def left(self) -> bool:
+        return bool(self.buttons() & Buttons.LEFT)
+
+    def right(self) -> bool:
+        return bool(self.buttons() & Buttons.RIGHT)
+
+    def basic_attack(self) -> bool:
+        return bool(self.buttons() & Buttons.ATTACK)
+
+
+def replay_inputs(replay: Replay) -> tuple[ReplayInput, ReplayInput]:
+    return (ReplayInput(replay, 0), ReplayInput(replay, 1))
+
+
+class Keyframes:
+
+    # Snapshots of the map at its keyframe ticks, taken as it steps through them
+    def __init__(self, game_map: BaseMap, replay: Replay):
+        self.map = game_map
+        self.replay = replay
+        self._snapshots: dict[int, MapSnapshot] = {}
+
+    @property
+    def ticks(self) -> int:
+        return self.map.space.time.ticks
+
+    # Step the map, call it instead of the map's fixed_update
+    def fixed_update(self):
+        ticks = self.ticks
+        if ticks % REPLAY_KEYFRAME_TICKS == 0 and ticks not in self._snapshots:
+            self._snapshots[ticks] = self.map.snapshot()
+            self._thin(ticks - KEYFRAME_HORIZON_TICKS, REPLAY_KEYFRAME_TICKS * KEYFRAME_THINNING)
+
+        self.map.fixed_update()
+
+    # Drop the snapshots before the tick that aren't on the stride
+    def _thin(self, before: int, stride: int):
+        for t in [t for t in self._snapshots if t < before and t % stride != 0]:
+            del self._snapshots[t]
+
+    # Seek within the recording, back by restoring the last snapshot before the tick and forward by
+    # stepping. Snapshots past the map's tick are of steps it hasn't taken, so they aren't restored
+    def seek(self, tick: int):
+        tick = min(max(tick, 0), len(self.replay))
+        if tick < self.ticks:
+            start = max(t for t in self._snapshots if t <= tick)
+            self.map.restore(self._snapshots[start])
+
+        while self.ticks < tick:
+            self.fixed_update()
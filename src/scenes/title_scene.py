@@ -1,10 +1,16 @@
+from typing import TYPE_CHECKING, Optional
+
 import pygame
 from pygame import Surface
 
 from scenes.common import Button, RatioRect, render_text
+from system.assets import AssetKey, Assets
 from system.scenes import BaseScene, Scenes
 from system.screen import Screen
 
+if TYPE_CHECKING:
+    from scenes.maps import WindowsMap
+
 
 class TemplateButton(Button):
 
@@ -46,37 +52,51 @@ class TemplateButton(Button):
 
 class PlayButton(TemplateButton):
 
-    def __init__(self):
+    def __init__(self, title: "TitleScene"):
         rect = RatioRect(0, 0.6, 0.15, 0.07)
         rect.centerx = 0.5
 
         super().__init__(rect, "Play")
 
+        self.title = title
+
     def update(self):
         if self.is_up_clicked(pygame.BUTTON_LEFT):
             from scenes.play_scene import PlayScene
             scenes = Scenes.instance()
-            scenes.change_scene(PlayScene())
+            scenes.change_scene(PlayScene(self.title.game_map))
 
         super().update()
 
 
 class TitleScene(BaseScene):
 
-    def __init__(self):
+    @classmethod
+    def assets(cls) -> list[AssetKey]:
+        return [("resources/start.png", Screen.instance().size, False)]
+
+    # game_map is the next match's map if the scene before built it
+    def __init__(self, game_map: Optional["WindowsMap"] = None):
         super().__init__()
 
-        background = pygame.image.load("resources/start.png")
-        background = pygame.transform.scale(background, Screen.instance().size)
-        self.background = background
+        self.background = Assets.instance().load(*self.assets()[0])
+
+        self.sprites.add(PlayButton(self))
 
-        self.sprites.add(PlayButton())
+        self.game_map = game_map
+        self._is_rendered = False
 
     def update(self):
         super().update()
 
+        # Once the title is on screen, so the hitch of building the map isn't on the Play click
+        if self.game_map is None and self._is_rendered:
+            from scenes.play_scene import prebuild_map
+            self.game_map = prebuild_map()
+
         self.sprites.update()
 
     def render(self):
         screen = Screen.instance()
         screen.render(self.background, self.sprites)
+        self._is_rendered = True
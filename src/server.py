@@ -0,0 +1,148 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+from multiprocessing.connection import Connection, wait
+from time import perf_counter
+
+import game
+from game_config import GameConfig
+from scenes.match_server import Lobby, MatchWorker
+from system.net import MAX_DATAGRAM
+
+logger = logging.getLogger(__name__)
+
+# Seconds between the checks a worker makes for new matches
+PIPE_POLL_SEC = 0.05
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run matches between remote players without a display")
+    parser.add_argument(
+        "--port", type=int, default=7700,
+        help="port clients join on, the workers listen on the ports after it")
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(),
+        help="processes running matches, one per core by default")
+    parser.add_argument(
+        "--bullet-mode", choices=("pymunk", "numpy"), default="pymunk",
+        help="how the bullets are simulated")
+    parser.add_argument(
+        "--report", type=float, default=10, metavar="SEC",
+        help="seconds between the tick time reports of every worker")
+    return parser.parse_args()
+
+
+async def serve(index: int, port: int, pipe: Connection, report_sec: float):
+    loop = asyncio.get_running_loop()
+    worker = MatchWorker()
+    transport, _ = await loop.create_datagram_endpoint(lambda: worker, local_addr=("0.0.0.0", port))
+
+    tasks: dict[asyncio.Task, int] = {}
+    report_start = perf_counter()
+
+    running = True
+    while running or tasks:
+        # Pipes can't be awaited on every platform, a short poll is late by a fraction of a tick at worst
+        while running and pipe.poll():
+            message = pipe.recv()
+            if message is None:
+                running = False
+                break
+            match_id, seed = message
+            tasks[worker.start(match_id, seed)] = match_id
+            logger.info("Worker %d started match %d", index, match_id)
+
+        for task in [task for task in tasks if task.done()]:
+            match_id = tasks.pop(task)
+            metrics = task.result()
+            pipe.send(match_id)
+            logger.info("Worker %d ended %s", index, metrics)
+
+        elapsed = perf_counter() - report_start
+        if elapsed >= report_sec:
+            report = [match.metrics() for match in worker.matches.values() if match.is_ready]
+            worst = max((metrics["step_p99_ms"] for metrics in report), default=0.0)
+            logger.info("Worker %d: %d matches, %.0f%% busy, worst p99 step %.2f ms",
+                        index, len(worker.matches), worker.busy / elapsed * 100, worst)
+            worker.busy = 0.0
+            report_start = perf_counter()
+
+        await asyncio.sleep(PIPE_POLL_SEC)
+
+    transport.close()
+
+
+def run_worker(index: int, port: int, pipe: Connection, config: dict, report_sec: float):
+    logging.basicConfig(level=logging.INFO)
+    # Stopping is up to the lobby, which lets the running matches end
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    GameConfig.instance(headless=True, **config)
+    game.Game().instance().init_systems()
+
+    asyncio.run(serve(index, port, pipe, report_sec))
+
+
+def main():
+    args = parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    config = {"bullet_mode": args.bullet_mode}
+    GameConfig.instance(headless=True, **config)
+
+    # Spawned the way Windows always does, so a worker starts without the lobby's singletons
+    context = multiprocessing.get_context("spawn")
+    ports = [args.port + 1 + index for index in range(args.workers)]
+    pipes = []
+    processes = []
+    for index, port in enumerate(ports):
+        pipe, worker_pipe = context.Pipe()
+        process = context.Process(
+            target=run_worker, args=(index, port, worker_pipe, config, args.report), daemon=True)
+        process.start()
+        pipes.append(pipe)
+        processes.append(process)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("0.0.0.0", args.port))
+    lobby = Lobby(ports)
+    logger.info("Lobby on port %d, %d workers on ports %d-%d", args.port, args.workers, ports[0], ports[-1])
+
+    try:
+        while True:
+            for ready in wait([sock, *pipes]):
+                if ready is sock:
+                    try:
+                        data, address = sock.recvfrom(MAX_DATAGRAM)
+                    except ConnectionResetError:
+                        continue
+                    packets, started = lobby.receive(data, address)
+                    for client, packet in packets:
+                        sock.sendto(packet, client)
+                    if started is not None:
+                        worker, match_id, seed = started
+                        pipes[worker].send((match_id, seed))
+                else:
+                    # A match ended
+                    ready.recv()
+                    lobby.ended(pipes.index(ready))
+    except KeyboardInterrupt:
+        logger.info("Stopping, the running matches are played to the end")
+    except EOFError:
+        logger.error("A worker stopped, stopping the others")
+    finally:
+        sock.close()
+        for pipe, process in zip(pipes, processes):
+            if process.is_alive():
+                pipe.send(None)
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import hashlib
+import io
+import logging
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from threading import Lock
+from time import perf_counter
+from typing import Optional
+
+import pygame
+from pygame import Surface
+
+from common import SingletonInstane
+from game_config import GameConfig
+
+AssetKey = tuple[str, Optional[tuple[int, int]], bool]
+
+logger = logging.getLogger(__name__)
+
+
+def user_cache_dir() -> Path:
+    name = GameConfig.instance().name
+
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA", Path.home() / "AppData" / "Local")
+        return Path(base) / name / "cache"
+
+    base = os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")
+    return Path(base) / name.lower().replace(" ", "-")
+
+
+class Assets(SingletonInstane):
+
+    def __init__(self):
+        self._surfaces: dict[AssetKey, Surface]
+        self._pending: dict[AssetKey, Future]
+        self._executor: ThreadPoolExecutor
+        self._stats_lock: Lock
+        self._cache_dir: Optional[Path]
+
+        self.load_ms: float
+        self.disk_hits: int
+        self.disk_misses: int
+
+    def init(self):
+
+        self._surfaces = {}
+        self._pending = {}
+        self._executor = ThreadPoolExecutor(thread_name_prefix="assets")
+        self._stats_lock = Lock()
+
+        self._cache_dir = None
+        if GameConfig.instance().disk_cache:
+            self._cache_dir = user_cache_dir()
+
+        self.load_ms = 0
+        self.disk_hits = 0
+        self.disk_misses = 0
+
+    def release(self):
+        self._executor.shutdown(cancel_futures=True)
+
+    # Surfaces are shared by every caller, copy them before drawing on them
+    def load(self,
+             path: str,
+             size: Optional[tuple[int, int]] = None,
+             alpha: bool = True) -> Surface:
+        key = (path, size, alpha)
+
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            return surface
+
+        future = self._pending.pop(key, None)
+        if future is not None:
+            # Already being read by a worker, wait for it
+            surface = future.result()
+        else:
+            surface = self._read(path, size, alpha)
+
+        surface = self._convert(surface, alpha)
+        self._surfaces[key] = surface
+
+        return surface
+
+    # Start reading and scaling the assets on worker threads
+    def preload(self, keys: list[AssetKey]):
+        for key in keys:
+            if key in self._surfaces or key in self._pending:
+                continue
+            self._pending[key] = self._executor.submit(self._read, *key)
+
+    # Convert the assets the workers have finished, call it once per frame
+    def update(self):
+        done = [key for key, future in self._pending.items() if future.done()]
+        for key in done:
+            self.load(*key)
+
+    @property
+    def is_preloading(self) -> bool:
+        return len(self._pending) > 0
+
+    # Runs on worker threads, so it must not touch the display
+    def _read(self,
+              path: str,
+              size: Optional[tuple[int, int]],
+              alpha: bool) -> Surface:
+        start = perf_counter()
+
+        if size is None or self._cache_dir is None:
+            surface = self._decode(path, None, size)
+        else:
+            surface = self._read_cached(path, size, alpha)
+
+        with self._stats_lock:
+            self.load_ms += (perf_counter() - start) * 1000
+
+        return surface
+
+    def _read_cached(self,
+                     path: str,
+                     size: tuple[int, int],
+                     alpha: bool) -> Surface:
+        data = Path(path).read_bytes()
+
+        # Keyed by content, so an edited image never hits a stale entry
+        digest = hashlib.sha1(data).hexdigest()
+        pixel_format = "RGBA" if alpha else "RGB"
+        cache_file = self._cache_dir / f"{digest}_{size[0]}x{size[1]}.{pixel_format.lower()}"
+
+        try:
+            pixels = cache_file.read_bytes()
+        except OSError:
+            pixels = None
+
+        if pixels is not None and len(pixels) == size[0] * size[1] * len(pixel_format):
+            with self._stats_lock:
+                self.disk_hits += 1
+            return pygame.image.frombytes(pixels, size, pixel_format)
+
+        with self._stats_lock:
+            self.disk_misses += 1
+        surface = self._decode(path, data, size)
+
+        try:
+            self._cache_dir.mkdir(parents=True, exist_ok=True)
+            # Write then rename, so a crash never leaves a truncated entry behind
+            tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+            tmp_file.write_bytes(pygame.image.tobytes(surface, pixel_format))
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            logger.warning("Couldn't write the asset cache %s: %s", cache_file, e)
+
+        return surface
+
+    def _decode(self,
+                path: str,
+                data: Optional[bytes],
+                size: Optional[tuple[int, int]]) -> Surface:
+        if data is None:
+            surface = pygame.image.load(path)
+        else:
+            surface = pygame.image.load(io.BytesIO(data), path)
+
+        # Nearest neighbour scaling, so it doesn't matter that it runs before the conversion
+        if size is not None:
+            surface = pygame.transform.scale(surface, size)
+
+        return surface
+
+    def _convert(self, surface: Surface, alpha: bool) -> Surface:
+        # Convert to the display format once, so blits don't have to
+        if alpha:
+            return surface.convert_alpha()
+        return surface.convert()
+
+    def log_stats(self):
+        logger.info(
+            "Loading %d assets took %.1f ms summed over threads (%d from the disk cache, %d decoded), %.1f MiB held",
+            len(self._surfaces), self.load_ms, self.disk_hits, self.disk_misses, self.total_memory() / 2**20)
+        if logger.isEnabledFor(logging.DEBUG):
+            for key, size in sorted(self.memory().items(), key=lambda item: -item[1]):
+                logger.debug("%8.1f KiB %s", size / 2**10, key)
+
+    # Bytes of pixel data held by each cached surface
+    def memory(self) -> dict[AssetKey, int]:
+        return {
+            key: surface.get_pitch() * surface.get_height()
+            for key, surface in self._surfaces.items()
+        }
+
+    def total_memory(self) -> int:
+        return sum(self.memory().values())
@@ -1,4 +1,5 @@
-from time import time_ns
+from time import perf_counter, time_ns
+from typing import Union
 
 from pygame.time import Clock as PygameClock
 
@@ -14,35 +15,96 @@ class Clock(SingletonInstane):
 
     def __init__(self):
         self._clock: PygameClock
-        self._delta: int
+        self._last_tick: float
+        self._delta: float
+        self._accumulator: float
 
     def init(self):
 
         self._clock = PygameClock()
+        self._last_tick = perf_counter()
+        self._delta = 0.0
+        self._accumulator = 0.0
 
     def tick(self):
         fps = GameConfig.instance().fps
-        self._delta = self._clock.tick(fps)
+        self._clock.tick(fps)
+
+        # pygame only measures whole milliseconds, which makes the step count jitter
+        now = perf_counter()
+        self._delta = now - self._last_tick
+        self._last_tick = now
+
+        self._accumulator += self._delta
 
     def fps(self):
         return self._clock.get_fps()
 
+    # Length of one physics step, it doesn't depend on the frame rate
     def delta_sec(self) -> float:
-        # 파이썬이 구려서 그냥 상수씀 ㅅㄱ
-        fps = GameConfig.instance().fps
-        return 1 / fps
+        tick_rate = GameConfig.instance().tick_rate
+        return 1 / tick_rate
+
+    # Real time of the last frame
+    def frame_sec(self) -> float:
+        return self._delta
+
+    # Number of physics steps to run this frame
+    def fixed_steps(self) -> int:
+        dt = self.delta_sec()
+        steps = int(self._accumulator / dt)
+
+        max_steps = GameConfig.instance().max_ticks_per_frame
+        if steps > max_steps:
+            # Too far behind to catch up, let the game slow down instead of spiralling
+            steps = max_steps
+            self._accumulator = steps * dt + self._accumulator % dt
+
+        self._accumulator -= steps * dt
+        return steps
+
+    # How far the frame is between the last two physics steps, from 0 to 1
+    def alpha(self) -> float:
+        return min(self._accumulator / self.delta_sec(), 1.0)
+
+
+class WallTime:
+
+    def time_ms(self) -> float:
+        # Convert nanosecond to millisecond
+        return time_ns() // NS_TO_MS
+
+
+class SimulationTime:
+
+    def __init__(self):
+        self.ticks = 0
+
+    # Called once per physics step
+    def advance(self):
+        self.ticks += 1
+
+    def time_ms(self) -> float:
+        tick_rate = GameConfig.instance().tick_rate
+        return self.ticks * SECOND_MS / tick_rate
+
+
+TimeSource = Union[WallTime, SimulationTime]
+
+WALL_TIME = WallTime()
 
 
 class Timer:
 
-    def __init__(self, ms_: int):
+    # source is WALL_TIME or the SimulationTime of a map
+    def __init__(self, ms_: int, source: TimeSource = WALL_TIME):
         self.ms = ms_
+        self.source = source
         self._start = 0
         self.is_activate = False
 
-    def _time_ms(self) -> int:
-        # Convert nanosecond to millisecond
-        return time_ns() // NS_TO_MS
+    def _time_ms(self) -> float:
+        return self.source.time_ms()
 
     def start(self):
         self.is_activate = True
@@ -57,3 +119,9 @@ class Timer:
 
     def over(self) -> bool:
         return self.is_activate and self.remain() <= 0
+
+    def snapshot(self) -> tuple[float, bool]:
+        return (self._start, self.is_activate)
+
+    def restore(self, state: tuple[float, bool]):
+        self._start, self.is_activate = state
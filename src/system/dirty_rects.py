@@ -0,0 +1,124 @@
+import math
+from time import perf_counter
+from typing import NamedTuple
+
+import pygame
+from pygame import Rect
+
+# Weight of the newest measurement in the running update costs
+COST_SMOOTHING = 0.1
+# Frames after which the update way not taken is measured again, its cost may have changed
+REMEASURE_FRAMES = 240
+# Drawn rects past which merging them takes longer than pushing the whole display,
+# it grows faster than the rect count. Past it a partial update pushes them unmerged
+MAX_COALESCE_RECTS = 200
+
+
+# Merge overlapping and nearby rects while a merged rect redraws at most max_waste pixels that
+# no drawn rect covers, so the display gets a few larger rects instead of many small ones
+def coalesce(rects: list[Rect], max_waste: int) -> list[Rect]:
+    # Rects further apart than this can't merge within the budget unless they are very thin,
+    # touching rects are found with the extra pixel
+    margin = math.isqrt(max_waste) + 1
+
+    merged: list[Rect] = []
+    # Pixels drawn rects cover in each merged rect, overlaps between them counted once
+    covered: list[int] = []
+    for rect in sorted(rects, key=lambda rect: rect.x):
+        area = rect.w * rect.h
+        while True:
+            for i in rect.inflate(margin * 2, margin * 2).collidelistall(merged):
+                other = merged[i]
+                union = rect.union(other)
+                overlap = rect.clip(other)
+                union_covered = area + covered[i] - overlap.w * overlap.h
+                if union.w * union.h - union_covered <= max_waste:
+                    # The union may reach rects neither reached, so it is tried again
+                    merged[i] = merged[-1]
+                    merged.pop()
+                    covered[i] = covered[-1]
+                    covered.pop()
+                    rect = union
+                    area = union_covered
+                    break
+            else:
+                break
+        merged.append(rect)
+        covered.append(area)
+    return merged
+
+
+class FrameUpdate(NamedTuple):
+    # Rects the sprites drew, and the ones pushed to the display once merged
+    drawn_rects: int
+    pushed_rects: int
+    pushed_pixels: int
+    # The whole display was pushed, as it was measured to be cheaper
+    is_full: bool
+
+
+class DisplayUpdater:
+
+    # Pushes the rects drawn in a frame to the display, merged, or the whole display when
+    # the measured costs say a partial update of that many pixels would take longer
+    def __init__(self, area: Rect, max_waste: int, is_adaptive: bool):
+        self.area = area.copy()
+        self.max_waste = max_waste
+        self.is_adaptive = is_adaptive
+
+        # Running seconds of a full update, and per pixel of a partial one, None until measured
+        self._full_sec = None
+        self._pixel_sec = None
+        self._since_full = 0
+        self._since_partial = 0
+
+        self.last = FrameUpdate(0, 0, 0, False)
+
+    def _is_full_cheaper(self, pixels: int) -> bool:
+        if not self.is_adaptive:
+            return False
+        if pixels >= self.area.w * self.area.h:
+            return True
+
+        if self._full_sec is None or self._since_full >= REMEASURE_FRAMES:
+            return True
+        if self._pixel_sec is None or self._since_partial >= REMEASURE_FRAMES:
+            return False
+        return pixels * self._pixel_sec > self._full_sec
+
+    def update(self, rects: list[Rect]) -> FrameUpdate:
+        drawn = [rect for rect in rects if rect.w and rect.h]
+        if not drawn:
+            self.last = FrameUpdate(0, 0, 0, False)
+            return self.last
+
+        # Rects the whole display is already cheaper than aren't worth the time merging them
+        drawn_pixels = sum(rect.w * rect.h for rect in drawn)
+        is_many = len(drawn) > MAX_COALESCE_RECTS
+        is_full = (is_many and self.is_adaptive) or self._is_full_cheaper(drawn_pixels)
+
+        # Merging is part of what a partial update costs, and so are the pixels it adds,
+        # so its cost is timed and counted per drawn pixel as the choice is made by them
+        start = perf_counter()
+        if is_full:
+            pygame.display.update()
+        else:
+            merged = drawn if is_many else coalesce(drawn, self.max_waste)
+            pygame.display.update(merged)
+        elapsed = perf_counter() - start
+
+        if is_full:
+            self._full_sec = elapsed if self._full_sec is None else \
+                self._full_sec + (elapsed - self._full_sec) * COST_SMOOTHING
+            self._since_full = 0
+            self._since_partial += 1
+            self.last = FrameUpdate(len(drawn), 1, self.area.w * self.area.h, True)
+        else:
+            pixel_sec = elapsed / drawn_pixels
+            self._pixel_sec = pixel_sec if self._pixel_sec is None else \
+                self._pixel_sec + (pixel_sec - self._pixel_sec) * COST_SMOOTHING
+            self._since_partial = 0
+            self._since_full += 1
+            self.last = FrameUpdate(len(drawn), len(merged), sum(rect.w * rect.h for rect in merged), False)
+
+        return self.last
@@ -4,6 +4,7 @@ from collections import defaultdict
 import pygame
 
 from common import SingletonInstane
+from system.screen import Screen
 
 
 @dataclass
@@ -121,5 +122,6 @@ class EventHandler(SingletonInstane):
     def is_key_pressing(self) -> defaultdict:
         return self._key_event.is_pressing
 
+    # In the screen scenes draw into, which is smaller than the display when it is scaled by a blit
     def get_mouse_pos(self) -> tuple[int, int]:
-        return pygame.mouse.get_pos()
+        return Screen.instance().to_screen(pygame.mouse.get_pos())
@@ -0,0 +1,39 @@
+class RollingSamples:
+
+    # The last size samples, older ones are overwritten
+    def __init__(self, size: int):
+        self._samples = [0.0] * size
+        self._count = 0
+
+    def add(self, value: float):
+        self._samples[self._count % len(self._samples)] = value
+        self._count += 1
+
+    def __len__(self) -> int:
+        return min(self._count, len(self._samples))
+
+    # Oldest first
+    def values(self) -> list[float]:
+        size = len(self._samples)
+        if self._count <= size:
+            return self._samples[:self._count]
+        start = self._count % size
+        return self._samples[start:] + self._samples[:start]
+
+    # Samples added since the start, including overwritten ones
+    @property
+    def total(self) -> int:
+        return self._count
+
+    # Sorts a copy, so it is meant for reports rather than every frame
+    def percentile(self, q: float) -> float:
+        samples = sorted(self._samples[:len(self)])
+        if not samples:
+            return 0.0
+        return samples[min(int(q / 100 * len(samples)), len(samples) - 1)]
+
+    def max(self) -> float:
+        return max(self._samples[:len(self)], default=0.0)
+
+    def clear(self):
+        self._count = 0
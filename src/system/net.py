@@ -0,0 +1,98 @@
+import heapq
+import socket
+from random import Random
+from time import perf_counter, sleep
+from typing import Optional
+
+Address = tuple[str, int]
+
+# Larger than any packet the game sends
+MAX_DATAGRAM = 2048
+
+
+# "port", "host:port" or ":port", a missing host is default_host
+def parse_address(text: str, default_host: str) -> Address:
+    host, _, port = text.rpartition(":")
+    return (host or default_host, int(port))
+
+
+class LinkSimulator:
+
+    # Delays, reorders and drops outgoing datagrams the way a bad connection would,
+    # the defaults send everything at once
+    def __init__(self, latency_ms: int = 0, jitter_ms: int = 0, loss: float = 0.0):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.loss = loss
+
+        self._random = Random()
+        # (due time, send order, data, address)
+        self._queue: list[tuple[float, int, bytes, Address]] = []
+        self._sent = 0
+
+    @property
+    def is_direct(self) -> bool:
+        return self.latency == 0 and self.jitter == 0 and self.loss == 0
+
+    def send(self, sock: socket.socket, data: bytes, address: Address):
+        if self.is_direct:
+            sock.sendto(data, address)
+            return
+
+        if self._random.random() < self.loss:
+            return
+
+        delay = max(self.latency + self._random.uniform(-self.jitter, self.jitter), 0)
+        heapq.heappush(self._queue, (perf_counter() + delay, self._sent, data, address))
+        self._sent += 1
+
+    # Send the datagrams that are due
+    def flush(self, sock: socket.socket):
+        now = perf_counter()
+        while self._queue and self._queue[0][0] <= now:
+            _, _, data, address = heapq.heappop(self._queue)
+            sock.sendto(data, address)
+
+    # Wait for every datagram still on the way, before the socket is closed
+    def drain(self, sock: socket.socket):
+        while self._queue:
+            sleep(max(self._queue[0][0] - perf_counter(), 0))
+            self.flush(sock)
+
+
+class Peer:
+
+    # A non-blocking UDP socket, talking to the remote address once it is known
+    def __init__(self, bind: Address, remote: Optional[Address] = None, link: Optional[LinkSimulator] = None):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(bind)
+        self.sock.setblocking(False)
+
+        # Resolved, so it compares equal to the sender of what arrives
+        if remote is not None:
+            remote = (socket.gethostbyname(remote[0]), remote[1])
+        self.remote = remote
+        self.link = link if link is not None else LinkSimulator()
+
+    def send(self, data: bytes):
+        self.link.send(self.sock, data, self.remote)
+        self.link.flush(self.sock)
+
+    # Every datagram that arrived since the last call, with its sender
+    def receive(self) -> list[tuple[bytes, Address]]:
+        self.link.flush(self.sock)
+
+        datagrams = []
+        while True:
+            try:
+                datagrams.append(self.sock.recvfrom(MAX_DATAGRAM))
+            except BlockingIOError:
+                break
+            except ConnectionResetError:
+                # Windows reports an earlier datagram to a closed port here
+                continue
+        return datagrams
+
+    def close(self):
+        self.link.drain(self.sock)
+        self.sock.close()
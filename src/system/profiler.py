@@ -0,0 +1,144 @@
+import logging
+from collections import defaultdict
+from time import perf_counter
+
+from common import SingletonInstane
+from game_config import GameConfig
+from system.metrics import RollingSamples
+
+logger = logging.getLogger(__name__)
+
+# Phases of a frame in the order they run
+PHASES = ("event", "update", "fixed", "physics", "callbacks", "render", "sprites", "draw", "present", "wait")
+# Phases measured inside another one, and that phase. Callbacks run inside the physics step
+NESTED_PHASES = {
+    "physics": "fixed",
+    "callbacks": "physics",
+    "sprites": "render",
+    "draw": "render",
+    "present": "render",
+}
+# Counted every frame
+COUNTERS = ("bullets", "callbacks", "drawn_rects", "pushed_rects", "pushed_pixels")
+
+
+# p50, p95 and p99 of seconds, in milliseconds
+def percentiles_ms(samples: RollingSamples) -> tuple[float, float, float]:
+    return (samples.percentile(50) * 1000, samples.percentile(95) * 1000, samples.percentile(99) * 1000)
+
+
+# Indented once for every phase it is nested in
+def phase_label(phase: str) -> str:
+    depth = 0
+    parent = NESTED_PHASES.get(phase)
+    while parent is not None:
+        depth += 1
+        parent = NESTED_PHASES.get(parent)
+    return "  " * depth + phase
+
+
+class Profiler(SingletonInstane):
+
+    # While disabled every call returns after checking is_enabled
+    def __init__(self):
+        self.is_enabled = False
+        self._is_toggled = False
+
+        # Seconds and counts of the frame being measured
+        self._frame = dict.fromkeys(PHASES, 0.0)
+        self._counts: defaultdict[str, int] = defaultdict(int)
+        self._frame_start = 0.0
+        self._last_mark = 0.0
+
+        # Last frames of every phase, counter and of whole frames
+        self.phases: dict[str, RollingSamples] = {}
+        self.counters: dict[str, RollingSamples] = {}
+        self.frames: RollingSamples
+
+    def init(self):
+
+        config = GameConfig.instance()
+        self.phases = {phase: RollingSamples(config.profile_frames) for phase in PHASES}
+        self.counters = {counter: RollingSamples(config.profile_frames) for counter in COUNTERS}
+        self.frames = RollingSamples(config.profile_frames)
+
+        self.is_enabled = config.profile
+        self._frame_start = self._last_mark = perf_counter()
+
+    # Takes effect once the frame ends, so no frame is measured in part
+    def toggle(self):
+        self._is_toggled = not self._is_toggled
+
+    # Ends the phase a frame is in, the loop marks its phases one after another
+    def mark(self, phase: str):
+        if not self.is_enabled:
+            return
+        now = perf_counter()
+        self._frame[phase] += now - self._last_mark
+        self._last_mark = now
+
+    # Nested phases are measured from start() to stop(), start() is 0 while disabled
+    def start(self) -> float:
+        return perf_counter() if self.is_enabled else 0.0
+
+    def stop(self, phase: str, start: float):
+        if self.is_enabled:
+            self._frame[phase] += perf_counter() - start
+
+    def count(self, counter: str, n: int = 1):
+        if self.is_enabled:
+            self._counts[counter] += n
+
+    def end_frame(self):
+        if self.is_enabled:
+            now = perf_counter()
+            self.frames.add(now - self._frame_start)
+
+            frame = self._frame
+            for phase, samples in self.phases.items():
+                samples.add(frame[phase])
+                frame[phase] = 0.0
+
+            counts = self._counts
+            for counter, samples in self.counters.items():
+                samples.add(counts[counter])
+            counts.clear()
+
+        if self._is_toggled:
+            self._is_toggled = False
+            self.is_enabled = not self.is_enabled
+            if self.is_enabled:
+                for samples in (self.frames, *self.phases.values(), *self.counters.values()):
+                    samples.clear()
+
+        if self.is_enabled:
+            self._frame_start = self._last_mark = perf_counter()
+
+    def log_report(self):
+        if not self.is_enabled or not len(self.frames):
+            return
+
+        lines = [f"Last {len(self.frames)} frames, ms p50/p95/p99:"]
+        for phase, samples in (("frame", self.frames), *self.phases.items()):
+            p50, p95, p99 = percentiles_ms(samples)
+            lines.append(f"  {phase_label(phase):<15} {p50:7.2f} {p95:7.2f} {p99:7.2f}")
+        for counter, samples in self.counters.items():
+            lines.append(f"  {counter:<15} {samples.percentile(50):7.0f} per frame, {samples.max():.0f} at most")
+        logger.info("\n".join(lines))
+
+
+# Wraps a collision callback so the profiler counts and times it
+def profiled_callback(callback):
+    profiler = Profiler.instance()
+
+    def profiled(arbiter, space, data):
+        if not profiler.is_enabled:
+            return callback(arbiter, space, data)
+
+        start = perf_counter()
+        result = callback(arbiter, space, data)
+        profiler.stop("callbacks", start)
+        profiler.count("callbacks")
+        return result
+
+    return profiled
@@ -4,21 +4,36 @@ from pygame import Surface
 from pygame.sprite import LayeredDirty
 
 from common import SingletonInstane
+from system.assets import AssetKey, Assets
 from system.screen import Screen
 
 
 class BaseScene:
 
+    # Images the scene loads, so they can be preloaded before it is built
+    @classmethod
+    def assets(cls) -> list[AssetKey]:
+        return []
+
     def __init__(self):
         self.background = Surface(Screen.instance().area.size)
         self.sprites = LayeredDirty()
 
+    # Called once per rendered frame
     def update(self):
         pass
 
+    # Called at the fixed physics rate, zero or more times per frame
+    def fixed_update(self):
+        pass
+
     def render(self):
         pass
 
+    # Called once the scene is replaced or the game quits
+    def release(self):
+        pass
+
 
 class Scenes(SingletonInstane):
 
@@ -33,17 +48,44 @@ class Scenes(SingletonInstane):
         self._next_scene = None
         self._scene = scene
 
+    @property
+    def scene(self) -> BaseScene:
+        return self._scene
+
+    # True from change_scene until the next update switches to the new scene
+    @property
+    def is_changed(self) -> bool:
+        return self._is_changed
+
     def change_scene(self, scene: BaseScene):
         self._is_changed = True
         self._next_scene = scene
 
+    # Start reading the assets of the scenes on worker threads
+    def preload(self, *scenes: type[BaseScene]):
+        keys = []
+        for scene in scenes:
+            keys.extend(scene.assets())
+        Assets.instance().preload(keys)
+
     def update(self):
+        assets = Assets.instance()
+        if assets.is_preloading:
+            assets.update()
+
         if self._is_changed:
+            self._scene.release()
             self._scene = self._next_scene
             self._next_scene = None
             self._is_changed = False
 
         self._scene.update()
 
+    def fixed_update(self):
+        self._scene.fixed_update()
+
     def render(self):
         self._scene.render()
+
+    def release(self):
+        self._scene.release()
@@ -1,38 +1,161 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from typing import NamedTuple, Optional
+
 import pygame
 from pygame import Rect, Surface
 from pygame.sprite import LayeredDirty
 
 from common import SingletonInstane
 from game_config import GameConfig
+from system.dirty_rects import DisplayUpdater, FrameUpdate
+from system.profiler import Profiler
+
+
+# Map coordinates and screen ratios to the pixels of one resolution, replaced when it changes.
+# The map is 16m of 100 coordinates wide, its y grows upwards and the screen's downwards
+class Viewport(NamedTuple):
+    width: int
+    height: int
+    pixel_per_coord: float
+
+    @classmethod
+    def of(cls, size: tuple[int, int]) -> "Viewport":
+        return cls(size[0], size[1], size[0] / 16 / 100)
+
+    def length_to_px(self, length: float) -> int:
+        return round(length * self.pixel_per_coord)
+
+    def size_to_px(self, width: float, height: float) -> tuple[int, int]:
+        ppc = self.pixel_per_coord
+        return (round(width * ppc), round(height * ppc))
+
+    def coord_to_px(self, x: float, y: float) -> tuple[int, int]:
+        ppc = self.pixel_per_coord
+        return (round(x * ppc), self.height - round(y * ppc))
+
+    # Many coordinates at once, an (n, 2) array of them gives an (n, 2) array of pixels
+    def coords_to_px(self, coords: "np.ndarray") -> "np.ndarray":
+        px = np.rint(coords * self.pixel_per_coord).astype(np.int32)
+        px[:, 1] = self.height - px[:, 1]
+        return px
+
+    # x, y, w and h as fractions of the screen
+    def ratio_to_px(self, x: float, y: float, w: float, h: float) -> Rect:
+        return Rect(self.width * x, self.height * y, self.width * w, self.height * h)
 
 
 class Screen(SingletonInstane):
 
     def __init__(self):
         self._screen_area: Rect
+        # What scenes draw into, the display unless it is scaled by a blit
         self.screen: Surface
+        self.viewport: Viewport
+
+        # Only set in the "blit" render mode, the display and the part of it the screen is scaled to
+        self._display: Optional[Surface] = None
+        self._present_area: Optional[Rect] = None
+
+        # Merges the dirty rects and picks between them and a full update, None in the "blit" mode
+        self._updater: Optional[DisplayUpdater] = None
+        # What the last render pushed to the display
+        self.last_update = FrameUpdate(0, 0, 0, False)
 
     def init(self):
 
+        config = GameConfig.instance()
+        if config.headless:
+            # Nothing is shown, the display only lets surfaces be converted
+            self._set_size(config.headless_size)
+            self.screen = pygame.display.set_mode(self._screen_area.size)
+            self._updater = DisplayUpdater(self._screen_area, config.dirty_rect_waste, False)
+            return
+
         # Set the screen size as big as possible
-        size = pygame.display.get_desktop_sizes()[0]
-        self._screen_area = Rect((0, 0), size)
+        desktop_size = pygame.display.get_desktop_sizes()[0]
 
-        # Set the display and Set the display to full screen
-        self.screen = pygame.display.set_mode(
-            self._screen_area.size,
-            flags=pygame.FULLSCREEN)
+        if config.render_mode == "native":
+            self._set_size(desktop_size)
+
+            # Set the display and Set the display to full screen
+            self.screen = pygame.display.set_mode(
+                self._screen_area.size,
+                flags=pygame.FULLSCREEN)
+        elif config.render_mode == "scaled":
+            # SDL scales the whole display to the monitor, keeping its aspect ratio
+            self._set_size(config.logical_size)
+            self.screen = pygame.display.set_mode(
+                self._screen_area.size,
+                flags=pygame.FULLSCREEN | pygame.SCALED)
+        else:
+            assert config.render_mode == "blit", "Invalid render mode"
+
+            self._set_size(config.logical_size)
+            self._display = pygame.display.set_mode(desktop_size, flags=pygame.FULLSCREEN)
+            self.screen = Surface(self._screen_area.size, 0, self._display)
+
+            # As large as fits with the screen's aspect ratio, the bars around it stay black
+            scale = min(desktop_size[0] / self.width, desktop_size[1] / self.height)
+            self._present_area = Rect(0, 0, round(self.width * scale), round(self.height * scale))
+            self._present_area.center = self._display.get_rect().center
+            self._display.fill("black")
+            pygame.display.flip()
+
+        if self._display is None:
+            self._updater = DisplayUpdater(self._screen_area, config.dirty_rect_waste, config.adaptive_full_update)
 
         # Set caption
-        caption = GameConfig.instance().name
+        caption = config.name
         pygame.display.set_caption(caption)
 
     def render(self,
                background: Surface,
                sprites: LayeredDirty):
+        profiler = Profiler.instance()
+
         # Draw scene
+        start = profiler.start()
         updates = sprites.draw(self.screen, background)
-        pygame.display.update(updates)
+        profiler.stop("draw", start)
+
+        start = profiler.start()
+        self.last_update = self._present(updates)
+        profiler.stop("present", start)
+
+        if profiler.is_enabled:
+            profiler.count("drawn_rects", self.last_update.drawn_rects)
+            profiler.count("pushed_rects", self.last_update.pushed_rects)
+            profiler.count("pushed_pixels", self.last_update.pushed_pixels)
+
+    def _present(self, updates: list[Rect]) -> FrameUpdate:
+        if self._updater is not None:
+            return self._updater.update(updates)
+
+        # Scaling only the dirty parts would sample them apart from their neighbours
+        # at fractional scales and show seams, so a frame with changes is scaled whole
+        if not updates:
+            return FrameUpdate(0, 0, 0, False)
+        pygame.transform.scale(self.screen, self._present_area.size, self._display.subsurface(self._present_area))
+        pygame.display.update(self._present_area)
+        return FrameUpdate(len(updates), 1, self._present_area.w * self._present_area.h, True)
+
+    # A position on the display, such as the mouse's, in the screen scenes draw into
+    def to_screen(self, pos: tuple[int, int]) -> tuple[int, int]:
+        if self._present_area is None:
+            return pos
+
+        area = self._present_area
+        return ((pos[0] - area.x) * self.width // area.width,
+                (pos[1] - area.y) * self.height // area.height)
+
+    # Every conversion to pixels goes through the viewport, so it changes with the size
+    def _set_size(self, size: tuple[int, int]):
+        self._screen_area = Rect((0, 0), size)
+        self.viewport = Viewport.of(size)
 
     @property
     def area(self) -> Rect:
@@ -0,0 +1,21 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# The game imports its modules from src and loads resources/ relative to the repo
+sys.path.insert(0, str(ROOT / "src"))
+os.chdir(ROOT)
+
+
+# GameConfig is a singleton, every test runs with the headless defaults
+@pytest.fixture(scope="session", autouse=True)
+def systems():
+    import game
+    from game_config import GameConfig
+
+    GameConfig.instance(headless=True)
+    game.Game().instance().init_systems()
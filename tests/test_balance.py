@@ -0,0 +1,29 @@
+import pytest
+
+from balance import wilson_interval
+
+
+def test_no_trials_says_nothing():
+    assert wilson_interval(0, 0) == (0.0, 1.0)
+
+
+def test_known_interval():
+    low, high = wilson_interval(5, 10)
+    assert low == pytest.approx(0.2366, abs=1e-4)
+    assert high == pytest.approx(0.7634, abs=1e-4)
+
+
+def test_interval_is_symmetric_and_clamped():
+    low, high = wilson_interval(3, 20)
+    other_low, other_high = wilson_interval(17, 20)
+    assert low == pytest.approx(1 - other_high)
+    assert high == pytest.approx(1 - other_low)
+
+    assert wilson_interval(0, 20)[0] == 0.0
+    assert wilson_interval(20, 20)[1] == 1.0
+
+
+def test_interval_narrows_with_trials():
+    low, high = wilson_interval(50, 100)
+    wide_low, wide_high = wilson_interval(5, 10)
+    assert wide_low < low < 0.5 < high < wide_high
@@ -0,0 +1,29 @@
+from system.clock import SimulationTime, Timer
+
+
+def test_timer_runs_on_simulation_ticks():
+    time = SimulationTime()
+    # 60 ticks a second by default
+    timer = Timer(500, time)
+    timer.start()
+
+    for _ in range(29):
+        time.advance()
+    assert not timer.over()
+
+    time.advance()
+    assert timer.over()
+
+
+def test_timer_restores_its_start():
+    time = SimulationTime()
+    timer = Timer(1000, time)
+    timer.start()
+    state = timer.snapshot()
+
+    for _ in range(60):
+        time.advance()
+    timer.start()
+    timer.restore(state)
+
+    assert timer.over()
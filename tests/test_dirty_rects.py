@@ -0,0 +1,40 @@
+import random
+
+from pygame import Rect
+
+from system.dirty_rects import coalesce
+
+
+def covers(merged: list[Rect], rect: Rect) -> bool:
+    return any(other.contains(rect) for other in merged)
+
+
+def test_overlapping_rects_merge():
+    assert coalesce([Rect(0, 0, 10, 10), Rect(5, 5, 10, 10)], 50) == [Rect(0, 0, 15, 15)]
+
+
+def test_far_rects_stay_apart():
+    rects = [Rect(0, 0, 10, 10), Rect(500, 500, 10, 10)]
+    assert sorted(coalesce(rects, 100)) == sorted(rects)
+
+
+def test_no_waste_only_merges_what_the_union_covers():
+    assert coalesce([Rect(0, 0, 10, 10), Rect(10, 0, 10, 10)], 0) == [Rect(0, 0, 20, 10)]
+    assert len(coalesce([Rect(0, 0, 10, 10), Rect(11, 0, 10, 10)], 0)) == 2
+
+
+def test_merged_rects_cover_every_rect_within_the_budget():
+    rng = random.Random(0)
+    for _ in range(200):
+        rects = [Rect(rng.randrange(300), rng.randrange(300), rng.randrange(1, 40), rng.randrange(1, 40))
+                 for _ in range(rng.randrange(1, 30))]
+        max_waste = rng.choice((0, 64, 2048))
+
+        merged = coalesce(rects, max_waste)
+
+        assert all(covers(merged, rect) for rect in rects)
+        for rect in merged:
+            inside = [other for other in rects if rect.contains(other)]
+            covered = sum(1 for x in range(rect.left, rect.right) for y in range(rect.top, rect.bottom)
+                          if any(other.collidepoint(x, y) for other in inside))
+            assert rect.w * rect.h - covered <= max_waste
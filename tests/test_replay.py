@@ -0,0 +1,104 @@
+import pytest
+from pygame.sprite import LayeredDirty
+
+from scenes.bots import bot_inputs
+from scenes.maps import WindowsMap
+from scenes.netplay import checksum
+from scenes.replay import Keyframes, Replay, ReplayRecorder, replay_inputs
+
+SEED = 7
+# Long enough for the bots to shoot and hit each other
+MAX_TICKS = 900
+
+
+def state(game_map: WindowsMap) -> int:
+    return checksum(game_map.snapshot())
+
+
+def is_over(game_map: WindowsMap) -> bool:
+    return game_map.player1.hp <= 0 or game_map.player2.hp <= 0
+
+
+# Checksums of a map by its tick, from the tick it is at
+def play(game_map: WindowsMap, ticks: int = MAX_TICKS) -> dict[int, int]:
+    states = {game_map.space.time.ticks: state(game_map)}
+    while game_map.space.time.ticks < ticks and not is_over(game_map):
+        game_map.fixed_update()
+        states[game_map.space.time.ticks] = state(game_map)
+    return states
+
+
+# A bot match recorded to a file, with the checksums it went through
+@pytest.fixture(scope="module")
+def recording(tmp_path_factory) -> tuple[str, dict[int, int]]:
+    path = tmp_path_factory.mktemp("replays") / "match.wolr"
+
+    game_map = WindowsMap(LayeredDirty(), SEED, bot_inputs(("hard", "easy"), SEED))
+    game_map.recorder = ReplayRecorder(path, SEED)
+    states = play(game_map)
+    game_map.recorder.close()
+
+    return str(path), states
+
+
+def replayed(path: str) -> tuple[WindowsMap, Replay]:
+    replay = Replay.load(path)
+    return WindowsMap(LayeredDirty(), replay.seed, replay_inputs(replay)), replay
+
+
+def test_a_seed_and_inputs_replay_the_same_match(recording):
+    path, states = recording
+    replay = Replay.load(path)
+
+    first = WindowsMap(LayeredDirty(), replay.seed, replay_inputs(replay))
+    second = WindowsMap(LayeredDirty(), replay.seed, replay_inputs(replay))
+
+    assert play(first) == play(second)
+
+
+def test_replay_reproduces_the_recorded_match(recording):
+    path, states = recording
+    game_map, replay = replayed(path)
+
+    assert len(replay) == max(states)
+    assert play(game_map) == states
+
+
+def test_other_files_are_not_loaded(tmp_path):
+    path = tmp_path / "other.wolr"
+    path.write_bytes(b"WOLREPLAY 1\n{}\n")
+
+    with pytest.raises(ValueError):
+        Replay.load(str(path))
+
+
+def test_seek_lands_on_the_recorded_states(recording):
+    path, states = recording
+    game_map, replay = replayed(path)
+    keyframes = Keyframes(game_map, replay)
+
+    for tick in (400, 130, 0, 250, 251, 60, len(replay)):
+        keyframes.seek(tick)
+        assert keyframes.ticks == tick
+        assert state(game_map) == states[tick]
+
+
+def test_rollback_replays_the_corrected_inputs(recording):
+    path, states = recording
+    game_map, replay = replayed(path)
+
+    # The other player's inputs are mispredicted from tick 100, as held from tick 99
+    predicted = bytearray(replay.steps)
+    for tick in range(100, len(predicted)):
+        predicted[tick] = predicted[tick] & 0x0F | predicted[99] & 0xF0
+    steps, replay.steps = replay.steps, bytes(predicted)
+
+    play(game_map, 96)
+    snapshot = game_map.snapshot()
+    play(game_map, 200)
+    assert state(game_map) != states[200]
+
+    replay.steps = steps
+    game_map.restore(snapshot)
+    assert state(game_map) == states[96]
+    assert play(game_map, 200) == {tick: states[tick] for tick in range(96, 201)}
@@ -0,0 +1,29 @@
+from scenes.common import TextCache
+
+
+def test_least_recently_used_text_is_evicted():
+    cache = TextCache()
+    cache.capacity = 2
+
+    a = cache.render("a", 20, "white")
+    cache.render("b", 20, "white")
+    # Used again, so "b" is the oldest when "c" comes in
+    assert cache.render("a", 20, "white") is a
+    cache.render("c", 20, "white")
+
+    assert list(cache._surfaces) == [("a", 20, "white"), ("c", 20, "white")]
+    assert (cache.hits, cache.misses) == (1, 3)
+
+    cache.render("b", 20, "white")
+    assert cache.misses == 4
+    assert ("a", 20, "white") not in cache._surfaces
+
+
+def test_size_and_color_are_part_of_the_key():
+    cache = TextCache()
+
+    cache.render("a", 20, "white")
+    cache.render("a", 21, "white")
+    cache.render("a", 20, "black")
+
+    assert (cache.hits, cache.misses) == (0, 3)